@@ -0,0 +1,152 @@
+"""
+Short-lived caches for the WebSocket connect path.
+
+Every socket connect resolves the JWT user and checks conversation
+membership. Both are cached in the Django cache (Redis) with a short TTL
+and invalidated from chats.signals when users or participants change.
+Hit and miss counts are buffered in-process and flushed to the cache in
+batches so the metrics don't add a round trip per lookup.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from collections import Counter
+import logging
+import threading
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+CACHE_NAMES = ('participants', 'user')
+
+# Cached in place of a participant list when the conversation doesn't exist
+_MISSING = '__missing__'
+
+_stats = Counter()
+_stats_pending = 0
+_stats_lock = threading.Lock()
+
+
+def _ttl():
+    return settings.CHAT_ACCESS_CACHE_TTL
+
+
+def participants_key(conversation_id):
+    return f'chat:participants:{conversation_id}'
+
+
+def user_key(user_id):
+    # "fields" keeps entries from the pickled-model format from being read back
+    return f'chat:user:fields:{user_id}'
+
+
+def stats_key(name, outcome):
+    return f'chat:cache_stats:{name}:{outcome}'
+
+
+def _record(name, hit):
+    """Count a hit or miss, flushing the buffered counts every few hundred lookups"""
+    global _stats_pending
+    with _stats_lock:
+        _stats[name, 'hit' if hit else 'miss'] += 1
+        _stats_pending += 1
+        if _stats_pending < settings.CHAT_ACCESS_CACHE_STATS_FLUSH_EVERY:
+            return
+        pending = dict(_stats)
+        _stats.clear()
+        _stats_pending = 0
+    flush_stats(pending)
+
+
+def flush_stats(pending=None):
+    """Add buffered hit/miss counts to the shared counters in the cache"""
+    if pending is None:
+        global _stats_pending
+        with _stats_lock:
+            pending = dict(_stats)
+            _stats.clear()
+            _stats_pending = 0
+    for (name, outcome), count in pending.items():
+        key = stats_key(name, outcome)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+        except Exception as e:
+            logger.warning("Could not flush cache stats for %s: %s", key, e)
+
+
+def get_stats():
+    """Hit/miss counters and hit rate per cache, as seen by all processes"""
+    stats = {}
+    for name in CACHE_NAMES:
+        hits = cache.get(stats_key(name, 'hit'), 0)
+        misses = cache.get(stats_key(name, 'miss'), 0)
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else None,
+        }
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([stats_key(name, outcome) for name in CACHE_NAMES for outcome in ('hit', 'miss')])
+
+
+def get_participant_set(conversation_id):
+    """IDs of the conversation's participants, or None if the conversation doesn't exist"""
+    key = participants_key(conversation_id)
+    cached = cache.get(key)
+    if cached is not None:
+        _record('participants', hit=True)
+        return None if cached == _MISSING else cached
+    _record('participants', hit=False)
+
+    from .models import Conversation
+    participant_ids = set(
+        Conversation.participants.through.objects
+        .filter(conversation_id=conversation_id)
+        .values_list('user_id', flat=True)
+    )
+    if not participant_ids and not Conversation.objects.filter(id=conversation_id).exists():
+        cache.set(key, _MISSING, _ttl())
+        return None
+    cache.set(key, participant_ids, _ttl())
+    return participant_ids
+
+
+def is_participant(conversation_id, user_id):
+    participant_ids = get_participant_set(conversation_id)
+    return participant_ids is not None and user_id in participant_ids
+
+
+def invalidate_participants(conversation_id):
+    cache.delete(participants_key(conversation_id))
+
+
+# Only what the socket consumers read; never the password hash or profile
+_USER_FIELDS = ('id', 'username', 'is_active')
+
+
+def get_user(user_id):
+    """
+    Fetch a user by ID through the cache; raises User.DoesNotExist.
+
+    The cached entry holds _USER_FIELDS only, so the result is an unsaved
+    User carrying just those fields. Load the full row before using anything
+    else.
+    """
+    key = user_key(user_id)
+    fields = cache.get(key)
+    if fields is not None:
+        _record('user', hit=True)
+        return User(**fields)
+    _record('user', hit=False)
+    fields = User.objects.values(*_USER_FIELDS).get(id=user_id)
+    cache.set(key, fields, _ttl())
+    return User(**fields)
+
+
+def invalidate_user(user_id):
+    cache.delete(user_key(user_id))
@@ -0,0 +1,107 @@
+"""
+Debounced Conversation.updated_at.
+
+Sending a message records the time in the Redis hash conversation:updated_at
+instead of updating the conversation row. The flush_conversation_activity
+task writes the changed conversations to MySQL with one bulk UPDATE per
+batch, so a busy conversation costs one row write per flush interval rather
+than one per message. Until then the inbox reads the fresher Redis value.
+"""
+from datetime import datetime, timezone
+from core.redis_client import get_redis
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# conversation_id -> time of the last message (unix seconds), until flushed
+UPDATED_AT_KEY = 'conversation:updated_at'
+# Conversations bumped since the last flush
+DIRTY_KEY = 'conversation:dirty'
+
+# Only ever moves the timestamp forward
+_TOUCH_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current or tonumber(current) < tonumber(ARGV[2]) then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+"""
+
+# Drops flushed values that were not bumped again meanwhile
+_FORGET_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+"""
+
+_touch_script = None
+_forget_script = None
+
+
+def touch(conversation_id, timestamp=None):
+    """Record activity in a conversation; returns False if Redis is unavailable"""
+    global _touch_script
+    try:
+        if _touch_script is None:
+            _touch_script = get_redis().register_script(_TOUCH_SCRIPT)
+        _touch_script(
+            keys=[UPDATED_AT_KEY, DIRTY_KEY],
+            args=[str(conversation_id), repr(timestamp or time.time())]
+        )
+        return True
+    except Exception as e:
+        logger.warning("Failed to record conversation activity: %s", e)
+        return False
+
+
+def get_updated_at(conversation_ids):
+    """Pending updated_at values as aware datetimes, keyed like conversation_ids"""
+    conversation_ids = list(conversation_ids)
+    if not conversation_ids:
+        return {}
+    try:
+        timestamps = get_redis().hmget(UPDATED_AT_KEY, [str(cid) for cid in conversation_ids])
+    except Exception as e:
+        logger.warning("Failed to read conversation activity: %s", e)
+        return {}
+    return {
+        cid: datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+        for cid, timestamp in zip(conversation_ids, timestamps)
+        if timestamp is not None
+    }
+
+
+def pop_dirty(batch_size):
+    """Take up to batch_size bumped conversations: {conversation_id: raw timestamp}"""
+    r = get_redis()
+    conversation_ids = r.spop(DIRTY_KEY, batch_size)
+    if not conversation_ids:
+        return {}
+    timestamps = r.hmget(UPDATED_AT_KEY, conversation_ids)
+    return {
+        conversation_id: timestamp
+        for conversation_id, timestamp in zip(conversation_ids, timestamps)
+        if timestamp is not None
+    }
+
+
+def mark_dirty(conversation_ids):
+    """Put conversations back in the flush queue, e.g. after a failed write"""
+    if conversation_ids:
+        get_redis().sadd(DIRTY_KEY, *conversation_ids)
+
+
+def forget(flushed):
+    """Stop overlaying values that are now in MySQL ({conversation_id: raw timestamp})"""
+    global _forget_script
+    if not flushed:
+        return
+    if _forget_script is None:
+        _forget_script = get_redis().register_script(_FORGET_SCRIPT)
+    args = []
+    for conversation_id, timestamp in flushed.items():
+        args.extend([conversation_id, timestamp])
+    _forget_script(keys=[UPDATED_AT_KEY], args=args)
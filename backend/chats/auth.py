@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from .access_cache import get_user
 import logging
 
 User = get_user_model()
@@ -19,7 +20,11 @@ def get_user_from_token(token):
         user_id = access_token['user_id']
         
         logger.debug(f"Extracted user_id {user_id} from token")
-        return User.objects.get(id=user_id)
+        user = get_user(user_id)
+        if not user.is_active:
+            logger.warning(f"Inactive user {user_id} rejected")
+            return AnonymousUser()
+        return user
     except (InvalidToken, TokenError) as e:
         logger.error(f"Token error: {str(e)}")
         return AnonymousUser()
@@ -24,11 +24,12 @@ def connect_to_cassandra():
             connect_timeout=30
         )
         
-        # Sync table to ensure schema is up to date
-        from chats.cassandra_models import ChatMessage
-        table_name = getattr(ChatMessage, '__table_name__', None)
-        logger.info(f"Syncing table: {table_name}")
-        sync_table(ChatMessage)
+        # Sync tables to ensure schema is up to date
+        from chats.cassandra_models import CASSANDRA_MODELS
+        for model in CASSANDRA_MODELS:
+            table_name = getattr(model, '__table_name__', None)
+            logger.info(f"Syncing table: {table_name}")
+            sync_table(model)
         
         logger.info(f"Successfully connected to Cassandra keyspace {settings.CASSANDRA_KEYSPACE}")
         return True
@@ -36,6 +37,22 @@ def connect_to_cassandra():
         logger.error(f"Failed to connect to Cassandra: {str(e)}")
         return False
 
+def reconnect_to_cassandra():
+    """
+    Open a new session in a forked process (Celery prefork children).
+    The driver's session and its IO threads don't survive a fork, and the
+    statements prepared on it go with it.
+    """
+    from chats import message_store
+    message_store.forget_prepared_statements()
+    connection.setup(
+        settings.CASSANDRA_HOSTS,
+        settings.CASSANDRA_KEYSPACE,
+        retry_connect=True,
+        connect_timeout=30
+    )
+    logger.info("Reconnected to Cassandra in process %s", os.getpid())
+
 def check_cassandra_connection():
     """
     Kiểm tra kết nối Cassandra hiện có, nếu mất kết nối thì thử kết nối lại.
@@ -1,415 +1,693 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.utils import timezone
-from .models import Conversation
-from .cassandra_models import ChatMessage
+from cassandra.util import uuid_from_time
+from .cassandra_models import ChatMessage, ConversationReadState, newest_message_id, to_user_uuid
+from .conversation_utils import get_participant_ids, record_message_sent
+from .access_cache import get_participant_set
+from . import unread
+from . import presence
+from . import typing_indicators
+from . import event_log
+from .event_log import conversation_group_name
+from . import write_behind
+from .tasks import persist_pending_messages
+from .log_filters import message_logger
+from .wire import encode_frame
+from datetime import datetime
+import asyncio
+import logging
 import uuid
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
-class ConversationConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        self.user = self.scope["user"]
-        
-        print("\n===== DEBUG: WebSocket Consumer xử lý kết nối =====")
-        print(f"User: {self.user}, Anonymous: {self.user.is_anonymous}")
-        
-        # Anonymous users can't connect
-        if self.user.is_anonymous:
-            print("WebSocket connection rejected: Anonymous user")
-            await self.close()
-            return
-            
-        # Get conversation ID from URL
-        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
-        print(f"Conversation ID: {self.conversation_id}")
-        
-        # Check if user is a participant in this conversation
-        if not await self.is_participant():
-            print(f"WebSocket connection rejected: User {self.user.id} is not a participant in conversation {self.conversation_id}")
-            await self.close()
-            return
-            
-        # Create a unique group name for this conversation
-        self.room_group_name = f'conversation_{self.conversation_id}'
-        
-        # Join the group
+class ChatConsumerBase(AsyncWebsocketConsumer):
+    """
+    Frame handling shared by the per-conversation and the per-user sockets.
+
+    Every handler takes the conversation the frame is about, and every group
+    event carries its conversation_id so a socket subscribed to several
+    conversations can tell them apart.
+    """
+    frame_handlers = {
+        'message': 'handle_chat_message',
+        'typing': 'handle_typing_indicator',
+        'read': 'handle_read_receipt',
+        'edit': 'handle_edit_message',
+        'delete': 'handle_delete_message',
+        'pin': 'handle_pin_message',
+        'unpin': 'handle_unpin_message',
+        'resume': 'handle_resume',
+    }
+
+    async def join_presence(self):
+        """Register this socket and tell the user's contacts if they just came online"""
         await self.channel_layer.group_add(
-            self.room_group_name,
+            presence.user_group_name(self.user.id),
             self.channel_name
         )
-        
-        # Accept the connection
-        await self.accept()
-        print(f"WebSocket connection accepted for user {self.user.id} in conversation {self.conversation_id}")
-        
-        # Update user status to online
-        await self.update_user_status('online')
+        came_online, watchers = await self.presence_connect()
+        # The lease is renewed server-side, so clients need not send heartbeats
+        self.presence_renewal = asyncio.create_task(self.renew_presence())
+        if came_online:
+            await presence.abroadcast_presence(self.channel_layer, self.user.id, 'online', watchers)
 
-    async def disconnect(self, close_code):
-        # Leave the group
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
-              # Update user status to offline
-        await self.update_user_status('offline')
-        
-    async def receive(self, text_data):
-        """
-        Receive message from WebSocket.
+    async def renew_presence(self):
+        """Renew this socket's presence lease for as long as it stays open"""
+        try:
+            while True:
+                await asyncio.sleep(settings.PRESENCE_RENEW_INTERVAL)
+                try:
+                    await self.presence_renew()
+                except Exception as e:
+                    logger.warning("Renewing presence of user %s failed: %s", self.user.id, e)
+        except asyncio.CancelledError:
+            pass
+
+    async def leave_presence(self):
+        renewal = getattr(self, 'presence_renewal', None)
+        if renewal:
+            renewal.cancel()
+        await self.channel_layer.group_discard(
+            presence.user_group_name(self.user.id),
+            self.channel_name
+        )
+        went_offline, watchers = await self.presence_disconnect()
+        if went_offline:
+            await presence.abroadcast_presence(self.channel_layer, self.user.id, 'offline', watchers)
+
+    async def handle_heartbeat(self):
+        await self.presence_heartbeat()
+        await self.send(text_data=json.dumps({'type': 'heartbeat'}))
+
+    async def broadcast(self, conversation_id, frame, sequenced=True):
+        """Send a client frame to everyone in the conversation.
+
+        The frame is encoded once here; recipient sockets forward the text as-is.
+        Sequenced frames get the conversation's next "seq" and can be replayed
+        with a resume frame (see event_log).
         """
-        data = json.loads(text_data)
-        message_type = data.get('type', 'message')
-        
-        if message_type == 'message':
-            # Process a new chat message
-            await self.handle_chat_message(data)
-        elif message_type == 'typing':
-            # Process typing indicator
-            await self.handle_typing_indicator(data)        
-        elif message_type == 'read':
-            # Process read receipts
-            await self.handle_read_receipt(data)
-        elif message_type == 'edit':
-            # Process message edits
-            await self.handle_edit_message(data)
-        elif message_type == 'delete':
-            # Process message deletions
-            await self.handle_delete_message(data)
-        elif message_type == 'pin':
-            # Process message pins
-            await self.handle_pin_message(data)
-        elif message_type == 'unpin':
-            # Process message unpins
-            await self.handle_unpin_message(data)
-
-    async def handle_chat_message(self, data):
-        print("===== DEBUG: Lưu và broadcast tin nhắn =====")
+        text = encode_frame(frame)
+        if sequenced:
+            text = await self.log_event(conversation_id, text)
+        await self.channel_layer.group_send(
+            conversation_group_name(conversation_id),
+            {'type': 'forward_frame', 'frame': text}
+        )
+
+    async def dispatch_frame(self, conversation_id, data):
+        handler = self.frame_handlers.get(data.get('type', 'message'))
+        if handler:
+            await getattr(self, handler)(conversation_id, data)
+
+    async def handle_chat_message(self, conversation_id, data):
         text = data.get('text', '')
-        print(f"Nội dung tin nhắn: {text}")
-        
-        # Store message in Cassandra
-        message = await self.save_message(text)
-        print(f"Đã lưu tin nhắn với ID: {message.message_id}")
-        
+
+        if settings.CHAT_WRITE_BEHIND:
+            # Broadcast now, the write-behind queue stores it
+            message = await self.queue_message(conversation_id, text)
+            if message is None:
+                await self.send(text_data=encode_frame(write_behind.failure_frame(
+                    conversation_id, None, 'Too many messages pending, try again later'
+                )))
+                return
+            message_logger.debug("Queued message %s from user %s in conversation %s (%d chars)",
+                                 message.message_id, self.user.id, conversation_id, len(text))
+        else:
+            # Store message in Cassandra
+            message = await self.save_message(conversation_id, text)
+            message_logger.debug("Saved message %s from user %s in conversation %s (%d chars)",
+                                 message.message_id, self.user.id, conversation_id, len(text))
+
         # Broadcast message to group
-        message_data = {
-            'type': 'chat_message',
+        await self.broadcast(conversation_id, {
+            'type': 'message',
+            'conversation_id': conversation_id,
             'message': {
                 'id': str(message.message_id),
                 'sender_id': str(message.sender_id),
                 'text': message.text,
                 'timestamp': message.message_timestamp.isoformat(),
             }
-        }
-        print(f"Broadcast tin nhắn tới group {self.room_group_name}: {message_data}")
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            message_data
-        )
+        })
 
-    async def handle_typing_indicator(self, data):
-        # Broadcast typing indicator to group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'typing_indicator',
-                'user_id': str(self.user.id),
-                'is_typing': data.get('is_typing', False)
-            }
-        )
+    async def handle_typing_indicator(self, conversation_id, data):
+        is_typing = bool(data.get('is_typing', False))
+        # A newer frame replaces a change still waiting for the rate limit
+        deferred = self.deferred_typing().pop(conversation_id, None)
+        if deferred:
+            deferred.cancel()
+
+        # Only state changes are broadcast; repeated frames just extend the expiry
+        broadcast, retry_after = await self.update_typing(conversation_id, is_typing)
+        if not broadcast:
+            if retry_after:
+                self.deferred_typing()[conversation_id] = asyncio.create_task(
+                    self.retry_typing(conversation_id, is_typing, retry_after)
+                )
+            return
+
+        timers = self.typing_timers()
+        timer = timers.pop(conversation_id, None)
+        if timer:
+            timer.cancel()
+        if is_typing:
+            timers[conversation_id] = asyncio.create_task(self.expire_typing(conversation_id))
+        await self.broadcast_typing(conversation_id, is_typing)
+
+    async def broadcast_typing(self, conversation_id, is_typing):
+        # Typing state is transient, so it is neither numbered nor replayed
+        await self.broadcast(conversation_id, {
+            'type': 'typing',
+            'conversation_id': conversation_id,
+            'user_id': str(self.user.id),
+            'is_typing': is_typing
+        }, sequenced=False)
+
+    def typing_timers(self):
+        if not hasattr(self, '_typing_timers'):
+            self._typing_timers = {}
+        return self._typing_timers
+
+    def deferred_typing(self):
+        if not hasattr(self, '_deferred_typing'):
+            self._deferred_typing = {}
+        return self._deferred_typing
+
+    async def retry_typing(self, conversation_id, is_typing, delay):
+        """Apply a rate-limited typing change once its window has passed"""
+        try:
+            await asyncio.sleep(delay)
+            self.deferred_typing().pop(conversation_id, None)
+            await self.handle_typing_indicator(conversation_id, {'is_typing': is_typing})
+        except asyncio.CancelledError:
+            pass
+
+    async def expire_typing(self, conversation_id):
+        """Send "stopped typing" once the typing state expires without an explicit stop"""
+        try:
+            while True:
+                remaining = await self.typing_remaining(conversation_id)
+                if not remaining:
+                    break
+                await asyncio.sleep(remaining)
+            self.typing_timers().pop(conversation_id, None)
+            await self.broadcast_typing(conversation_id, False)
+        except asyncio.CancelledError:
+            pass
 
-    async def handle_read_receipt(self, data):
+    async def stop_typing(self):
+        """Clear typing state this socket started, e.g. when it disconnects"""
+        for deferred in self.deferred_typing().values():
+            deferred.cancel()
+        self.deferred_typing().clear()
+        for conversation_id, timer in list(self.typing_timers().items()):
+            timer.cancel()
+            broadcast, _ = await self.update_typing(conversation_id, False, force=True)
+            if broadcast:
+                await self.broadcast_typing(conversation_id, False)
+        self.typing_timers().clear()
+
+    async def handle_read_receipt(self, conversation_id, data):
+        # Either "read up to message_id" or a list whose newest entry counts
         message_ids = data.get('message_ids', [])
-        
+        if data.get('message_id'):
+            message_ids = [data['message_id']]
+
         # Mark messages as read
         if message_ids:
-            await self.mark_messages_as_read(message_ids)
-            
+            last_read_message_id = await self.mark_messages_as_read(conversation_id, message_ids)
+            if last_read_message_id is None:
+                return
+
             # Broadcast read receipt to group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'read_receipt',
-                    'user_id': str(self.user.id),
-                    'message_ids': message_ids
-                }
-            )
+            await self.broadcast(conversation_id, {
+                'type': 'read',
+                'conversation_id': conversation_id,
+                'user_id': str(self.user.id),
+                'message_ids': message_ids,
+                'last_read_message_id': str(last_read_message_id)
+            })
 
-    async def handle_edit_message(self, data):
+    async def handle_edit_message(self, conversation_id, data):
         message_id = data.get('message_id')
         new_text = data.get('text')
-        
+
         if not message_id or not new_text:
             return
-            
+
         # Check if the message exists and user is the sender
-        if not await self.can_modify_message(message_id):
+        if not await self.can_modify_message(conversation_id, message_id):
             return
-            
+
         # Update message in database
-        message = await self.edit_message(message_id, new_text)
-        
+        message = await self.edit_message(conversation_id, message_id, new_text)
+        if message is None:
+            return
+
         # Broadcast edited message to group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'edited_message',
-                'message_id': str(message.message_id),
-                'text': message.text,
-                'user_id': str(self.user.id),
-                'timestamp': message.edited_at.isoformat()
-            }
-        )
-        
-    async def handle_delete_message(self, data):
+        await self.broadcast(conversation_id, {
+            'type': 'edited',
+            'conversation_id': conversation_id,
+            'message_id': str(message.message_id),
+            'text': message.text,
+            'user_id': str(self.user.id),
+            'timestamp': message.edited_at.isoformat()
+        })
+
+    async def handle_delete_message(self, conversation_id, data):
         message_id = data.get('message_id')
-        
+
         if not message_id:
             return
-            
+
         # Check if the message exists and user is the sender
-        if not await self.can_modify_message(message_id):
+        if not await self.can_modify_message(conversation_id, message_id):
             return
-            
+
         # Delete message in database
-        message = await self.delete_message(message_id)
-        
+        message = await self.delete_message(conversation_id, message_id)
+        if message is None:
+            return
+
         # Broadcast deleted message to group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'deleted_message',
-                'message_id': str(message.message_id),
-                'user_id': str(self.user.id)
-            }
-        )
-    
-    async def handle_pin_message(self, data):
+        await self.broadcast(conversation_id, {
+            'type': 'deleted',
+            'conversation_id': conversation_id,
+            'message_id': str(message.message_id),
+            'user_id': str(self.user.id)
+        })
+
+    async def handle_pin_message(self, conversation_id, data):
         """Handle pinning a message"""
         message_id = data.get('message_id')
-        
+
         if not message_id:
             return
-            
+
         try:
             # Pin the message
-            message = await self.pin_message(message_id)
-            
+            message = await self.pin_message(conversation_id, message_id)
+
             # Broadcast pinned message to group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'pinned_message',
-                    'message_id': str(message.message_id),
-                    'user_id': str(self.user.id),
-                    'pinned_at': message.pinned_at.isoformat() if message.pinned_at else None
-                }
-            )
+            await self.broadcast(conversation_id, {
+                'type': 'pinned',
+                'conversation_id': conversation_id,
+                'message_id': str(message.message_id),
+                'user_id': str(self.user.id),
+                'pinned_at': message.pinned_at.isoformat() if message.pinned_at else None
+            })
         except Exception as e:
-            print(f"Error handling pin message: {str(e)}")
-    
-    async def handle_unpin_message(self, data):
+            logger.error("Error handling pin message %s: %s", message_id, e)
+
+    async def handle_unpin_message(self, conversation_id, data):
         """Handle unpinning a message"""
         message_id = data.get('message_id')
-        
+
         if not message_id:
             return
-            
+
         try:
             # Unpin the message
-            message = await self.unpin_message(message_id)
-            
+            message = await self.unpin_message(conversation_id, message_id)
+
             # Broadcast unpinned message to group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'unpinned_message',
-                    'message_id': str(message.message_id),
-                    'user_id': str(self.user.id)
-                }
-            )
+            await self.broadcast(conversation_id, {
+                'type': 'unpinned',
+                'conversation_id': conversation_id,
+                'message_id': str(message.message_id),
+                'user_id': str(self.user.id)
+            })
         except Exception as e:
-            print(f"Error handling unpin message: {str(e)}")
-        
-    async def chat_message(self, event):
-        # Send message to WebSocket
-        print("===== DEBUG: Gửi tin nhắn tới WebSocket client =====")
-        print(f"Event: {event}")
-        
-        message_data = {
-            'type': 'message',
-            'message': event['message']
-        }
-        print(f"Data gửi đi: {message_data}")
-        
-        await self.send(text_data=json.dumps(message_data))
-
-    async def typing_indicator(self, event):
-        # Send typing indicator to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'typing',
-            'user_id': event['user_id'],
-            'is_typing': event['is_typing']
-        }))
+            logger.error("Error handling unpin message %s: %s", message_id, e)
 
-    async def read_receipt(self, event):
-        # Send read receipt to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'read',
-            'user_id': event['user_id'],
-            'message_ids': event['message_ids']
-        }))
+    async def handle_resume(self, conversation_id, data):
+        """Replay the events after last_seq, or tell the client to resync over REST.
 
-    async def edited_message(self, event):
-        # Send edited message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'edited',
-            'message_id': event['message_id'],
-            'text': event['text'],
-            'user_id': event['user_id'],
-            'timestamp': event['timestamp']
-        }))
-        
-    async def deleted_message(self, event):
-        # Send deleted message notification to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'deleted',
-            'message_id': event['message_id'],
-            'user_id': event['user_id']
-        }))
-    
-    async def pinned_message(self, event):
-        """Send pinned message notification to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'pinned',
-            'message_id': event['message_id'],
-            'user_id': event['user_id'],
-            'pinned_at': event['pinned_at']
-        }))
-    
-    async def unpinned_message(self, event):
-        """Send unpinned message notification to WebSocket"""
+        Without last_seq it only reports the current sequence, e.g. right
+        after the client loaded the latest page.
+        """
+        try:
+            last_seq = int(data['last_seq']) if data.get('last_seq') is not None else None
+        except (TypeError, ValueError):
+            last_seq = None
+
+        frames, seq = await self.events_after(conversation_id, last_seq)
+        if frames is None:
+            await self.send(text_data=json.dumps({
+                'type': 'resync_required',
+                'conversation_id': conversation_id,
+                'seq': seq
+            }))
+            return
+
+        for frame in frames:
+            await self.send(text_data=frame)
         await self.send(text_data=json.dumps({
-            'type': 'unpinned',
-            'message_id': event['message_id'],
-            'user_id': event['user_id']
+            'type': 'resumed',
+            'conversation_id': conversation_id,
+            'seq': seq
         }))
 
+    async def forward_frame(self, event):
+        """Send a frame the sender already encoded (see broadcast)"""
+        message_logger.debug("Forwarding %d-byte frame to %s", len(event['frame']), self.channel_name)
+        await self.send(text_data=event['frame'])
+
     @database_sync_to_async
-    def is_participant(self):
+    def is_participant(self, conversation_id):
         try:
-            print(f"Checking if user {self.user.id} is participant in conversation {self.conversation_id}")
-            
             # Try to parse the UUID
-            conversation_id = uuid.UUID(self.conversation_id)
-            print(f"Valid UUID format: {conversation_id}")
-            
-            # Check if the conversation exists
-            conversation_exists = Conversation.objects.filter(id=conversation_id).exists()
-            if not conversation_exists:
-                print(f"Conversation {conversation_id} does not exist")
+            conversation_uuid = uuid.UUID(conversation_id)
+
+            # Membership is cached; the entry is dropped when participants change
+            participant_ids = get_participant_set(conversation_uuid)
+            if participant_ids is None:
+                logger.info("Conversation %s does not exist", conversation_uuid)
                 return False
-                
-            # Now check if user is a participant
-            is_participant = Conversation.objects.filter(
-                id=conversation_id,
-                participants=self.user
-            ).exists()
-            
-            print(f"User {self.user.id} is{' ' if is_participant else ' not '}a participant in conversation {conversation_id}")
-            return is_participant
-            
+
+            return self.user.id in participant_ids
+
         except ValueError as e:
-            print(f"Invalid UUID format: {self.conversation_id} - {str(e)}")
+            logger.info("Invalid conversation ID %r: %s", conversation_id, e)
             return False
         except Exception as e:
-            print(f"Error checking participant status: {str(e)}")
+            logger.error("Error checking participant status: %s", e)
             return False
 
-    @database_sync_to_async
-    def save_message(self, text):
-        message = ChatMessage.create_message(
-            conversation_id=uuid.UUID(self.conversation_id),
+    async def save_message(self, conversation_id, text):
+        participant_ids = await self.participant_ids(conversation_id)
+        message = await ChatMessage.acreate_message(
+            conversation_id=uuid.UUID(conversation_id),
             sender_id=self.user.id,
-            text=text
-        )
-        
-        # Update the Conversation's updated_at timestamp
-        Conversation.objects.filter(id=uuid.UUID(self.conversation_id)).update(
-            updated_at=timezone.now()
+            text=text,
+            participant_ids=participant_ids
         )
-        
+        await self.record_message_sent(conversation_id, participant_ids)
         return message
-    
+
     @database_sync_to_async
-    def mark_messages_as_read(self, message_ids):
-        for message_id in message_ids:
-            try:
-                ChatMessage.mark_as_read(
-                    conversation_id=uuid.UUID(self.conversation_id),
-                    message_id=uuid.UUID(message_id)
-                )
-            except Exception as e:
-                print(f"Error marking message {message_id} as read: {str(e)}")
-    
+    def participant_ids(self, conversation_id):
+        return get_participant_ids(conversation_id)
+
+    @database_sync_to_async
+    def record_message_sent(self, conversation_id, participant_ids):
+        record_message_sent(conversation_id, self.user.id, participant_ids)
+
     @database_sync_to_async
-    def update_user_status(self, status):
-        User.objects.filter(id=self.user.id).update(
-            status=status,
-            last_active=timezone.now()
+    def queue_message(self, conversation_id, text):
+        """Assign the message ID and queue the write; None if the queue is full"""
+        now = datetime.now()
+        message = ChatMessage(
+            conversation_id=uuid.UUID(conversation_id),
+            message_id=uuid_from_time(now),
+            message_timestamp=now,
+            sender_id=to_user_uuid(self.user.id),
+            text=text
         )
-        
+        length = write_behind.enqueue(conversation_id, self.user.id, message.message_id, now, text)
+        if not length:
+            return None
+        if length == 1:
+            persist_pending_messages.delay(conversation_id)
+        return message
+
+    async def mark_messages_as_read(self, conversation_id, message_ids):
+        """Move the user's read watermark up to the newest of message_ids"""
+        try:
+            last_read_message_id, unread_count = await ConversationReadState.amark_read(
+                conversation_id=uuid.UUID(conversation_id),
+                user_id=self.user.id,
+                message_id=newest_message_id(message_ids)
+            )
+            if unread_count is not None:
+                await self.set_unread(conversation_id, unread_count)
+            return last_read_message_id
+        except Exception as e:
+            logger.error("Error marking messages %s as read: %s", message_ids, e)
+            return None
+
+    @database_sync_to_async
+    def set_unread(self, conversation_id, count):
+        unread.set_unread(self.user.id, conversation_id, count)
+
+    @database_sync_to_async
+    def log_event(self, conversation_id, frame):
+        return event_log.append(conversation_id, frame)
+
+    @database_sync_to_async
+    def events_after(self, conversation_id, last_seq):
+        if last_seq is None:
+            return [], event_log.current_seq(conversation_id)
+        return event_log.events_after(conversation_id, last_seq)
+
+    @database_sync_to_async
+    def update_typing(self, conversation_id, is_typing, force=False):
+        return typing_indicators.update(conversation_id, self.user.id, is_typing, force=force)
+
+    @database_sync_to_async
+    def typing_remaining(self, conversation_id):
+        return typing_indicators.remaining(conversation_id, self.user.id)
+
     @database_sync_to_async
-    def can_modify_message(self, message_id):
+    def presence_connect(self):
+        came_online = presence.connect(self.user.id, self.channel_name)
+        return came_online, presence.watcher_ids(self.user.id) if came_online else []
+
+    @database_sync_to_async
+    def presence_disconnect(self):
+        went_offline = presence.disconnect(self.user.id, self.channel_name)
+        return went_offline, presence.watcher_ids(self.user.id) if went_offline else []
+
+    @database_sync_to_async
+    def presence_heartbeat(self):
+        presence.heartbeat(self.user.id, self.channel_name)
+
+    @database_sync_to_async
+    def presence_renew(self):
+        presence.renew(self.user.id, self.channel_name)
+
+    async def can_modify_message(self, conversation_id, message_id):
         """Check if the user can modify (edit or delete) this message"""
         try:
-            message = ChatMessage.objects.get(
-                conversation_id=uuid.UUID(self.conversation_id),
-                message_id=uuid.UUID(message_id)
-            )
+            message = await ChatMessage.aget_message(uuid.UUID(conversation_id), uuid.UUID(message_id))
             # User can only modify their own messages
-            return message.sender_id == self.user.id
+            return message.sender_id == to_user_uuid(self.user.id)
         except Exception as e:
-            print(f"Error checking if user can modify message: {str(e)}")
+            logger.error("Error checking if user can modify message %s: %s", message_id, e)
             return False
-    
-    @database_sync_to_async
-    def edit_message(self, message_id, new_text):
+
+    async def edit_message(self, conversation_id, message_id, new_text):
         """Edit a message's text"""
-        return ChatMessage.edit_message(
-            conversation_id=uuid.UUID(self.conversation_id),
+        return await ChatMessage.aedit_message(
+            conversation_id=uuid.UUID(conversation_id),
             message_id=uuid.UUID(message_id),
-            new_text=new_text
+            new_text=new_text,
+            participant_ids=await self.participant_ids(conversation_id)
         )
-    
-    @database_sync_to_async
-    def delete_message(self, message_id):
+
+    async def delete_message(self, conversation_id, message_id):
         """Soft delete a message"""
-        return ChatMessage.delete_message(
-            conversation_id=uuid.UUID(self.conversation_id),
-            message_id=uuid.UUID(message_id)
+        return await ChatMessage.adelete_message(
+            conversation_id=uuid.UUID(conversation_id),
+            message_id=uuid.UUID(message_id),
+            participant_ids=await self.participant_ids(conversation_id)
         )
-    
-    @database_sync_to_async
-    def pin_message(self, message_id):
+
+    async def pin_message(self, conversation_id, message_id):
         """Pin a message in the conversation"""
-        return ChatMessage.pin_message(
-            conversation_id=uuid.UUID(self.conversation_id),
+        return await ChatMessage.apin_message(
+            conversation_id=uuid.UUID(conversation_id),
             message_id=uuid.UUID(message_id),
-            user_id=self.user.id
+            user_id=self.user.id,
+            participant_ids=await self.participant_ids(conversation_id)
         )
-    
-    @database_sync_to_async
-    def unpin_message(self, message_id):
+
+    async def unpin_message(self, conversation_id, message_id):
         """Unpin a message in the conversation"""
-        return ChatMessage.unpin_message(
-            conversation_id=uuid.UUID(self.conversation_id),
-            message_id=uuid.UUID(message_id)
+        return await ChatMessage.aunpin_message(
+            conversation_id=uuid.UUID(conversation_id),
+            message_id=uuid.UUID(message_id),
+            participant_ids=await self.participant_ids(conversation_id)
         )
+
+
+class ConversationConsumer(ChatConsumerBase):
+    """One socket per conversation (ws/conversation/<id>/ and ws/chat/<id>/)"""
+
+    async def connect(self):
+        self.user = self.scope["user"]
+
+        # Anonymous users can't connect
+        if self.user.is_anonymous:
+            logger.info("WebSocket connection rejected: anonymous user")
+            await self.close()
+            return
+
+        # Get conversation ID from URL
+        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
+
+        # Check if user is a participant in this conversation
+        if not await self.is_participant(self.conversation_id):
+            logger.info("WebSocket connection rejected: user %s is not a participant in conversation %s",
+                        self.user.id, self.conversation_id)
+            await self.close()
+            return
+
+        # Create a unique group name for this conversation
+        self.room_group_name = conversation_group_name(self.conversation_id)
+
+        # Join the group
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+
+        # Accept the connection
+        await self.accept()
+        logger.debug("WebSocket connection accepted for user %s in conversation %s", self.user.id, self.conversation_id)
+
+        # Mark the user online; the user row is updated by the flush_presence task
+        await self.join_presence()
+
+    async def disconnect(self, close_code):
+        await self.stop_typing()
+        # Leave the group
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
+        if not self.user.is_anonymous and hasattr(self, 'room_group_name'):
+            await self.leave_presence()
+
+    async def receive(self, text_data):
+        """
+        Receive message from WebSocket.
+        """
+        data = json.loads(text_data)
+        if data.get('type') == 'heartbeat':
+            await self.handle_heartbeat()
+        else:
+            await self.dispatch_frame(self.conversation_id, data)
+
+
+def canonical_conversation_id(conversation_id):
+    """The hyphenated lowercase form server-side group names use, None if not a UUID"""
+    try:
+        return str(uuid.UUID(str(conversation_id)))
+    except ValueError:
+        return None
+
+
+class UserConsumer(ChatConsumerBase):
+    """
+    One socket per user (ws/user/) multiplexing all of their conversations.
+
+    The client subscribes to the conversations it is showing:
+        {"type": "subscribe", "conversation_ids": ["<id>", ...]}
+        {"type": "unsubscribe", "conversation_ids": ["<id>", ...]}
+    Every other frame names its conversation with "conversation_id", and
+    every event sent back carries the same key.
+    """
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if self.user.is_anonymous:
+            await self.close()
+            return
+
+        self.subscriptions = set()
+        await self.accept()
+        await self.join_presence()
+
+    async def disconnect(self, close_code):
+        await self.stop_typing()
+        for conversation_id in getattr(self, 'subscriptions', ()):
+            await self.channel_layer.group_discard(
+                conversation_group_name(conversation_id),
+                self.channel_name
+            )
+        if not self.user.is_anonymous:
+            await self.leave_presence()
+
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+        message_type = data.get('type', 'message')
+
+        if message_type == 'heartbeat':
+            await self.handle_heartbeat()
+        elif message_type in ('subscribe', 'unsubscribe'):
+            conversation_ids = self.frame_conversation_ids(data)
+            if conversation_ids is None:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'error': 'conversation_ids must be a list'
+                }))
+            elif message_type == 'subscribe':
+                await self.subscribe(conversation_ids)
+            else:
+                await self.unsubscribe(conversation_ids)
+        else:
+            conversation_id = canonical_conversation_id(data.get('conversation_id'))
+            if conversation_id not in self.subscriptions:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'conversation_id': data.get('conversation_id'),
+                    'error': 'Not subscribed to this conversation'
+                }))
+                return
+            await self.dispatch_frame(conversation_id, data)
+
+    def frame_conversation_ids(self, data):
+        """The IDs a (un)subscribe frame names, None unless conversation_ids is a list"""
+        conversation_ids = data.get('conversation_ids', [])
+        if not isinstance(conversation_ids, list):
+            return None
+        if data.get('conversation_id'):
+            conversation_ids = conversation_ids + [data['conversation_id']]
+        return conversation_ids
+
+    async def subscribe(self, conversation_ids):
+        subscribed, rejected = [], []
+        for requested_id in conversation_ids:
+            conversation_id = canonical_conversation_id(requested_id)
+            if conversation_id is None:
+                rejected.append(requested_id)
+            elif conversation_id in self.subscriptions:
+                subscribed.append(conversation_id)
+            elif await self.is_participant(conversation_id):
+                await self.channel_layer.group_add(
+                    conversation_group_name(conversation_id),
+                    self.channel_name
+                )
+                self.subscriptions.add(conversation_id)
+                subscribed.append(conversation_id)
+            else:
+                rejected.append(conversation_id)
+
+        await self.send(text_data=json.dumps({
+            'type': 'subscribed',
+            'conversation_ids': subscribed,
+            'rejected': rejected
+        }))
+
+    async def unsubscribe(self, conversation_ids):
+        conversation_ids = [canonical_conversation_id(conversation_id) for conversation_id in conversation_ids]
+        conversation_ids = [conversation_id for conversation_id in conversation_ids if conversation_id]
+        for conversation_id in conversation_ids:
+            if conversation_id in self.subscriptions:
+                self.subscriptions.discard(conversation_id)
+                await self.channel_layer.group_discard(
+                    conversation_group_name(conversation_id),
+                    self.channel_name
+                )
+
+        await self.send(text_data=json.dumps({
+            'type': 'unsubscribed',
+            'conversation_ids': conversation_ids
+        }))
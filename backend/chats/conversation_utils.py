@@ -1,7 +1,15 @@
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from .models import Conversation
+from .access_cache import get_participant_set
+from .cassandra_models import ChatMessage
+from . import activity
+from . import unread
+import logging
+import uuid
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 def get_or_create_direct_conversation(user1, user2):
     """
@@ -57,3 +65,56 @@ def create_group_conversation(creator, name, participant_ids):
             pass
     
     return conversation
+
+def get_participant_ids(conversation_id):
+    """
+    Lấy danh sách ID của các thành viên trong cuộc trò chuyện.
+    """
+    return list(get_participant_set(conversation_id) or ())
+
+
+def store_message(conversation_id, sender_id, text, message_id=None, message_timestamp=None):
+    """
+    Lưu tin nhắn vào Cassandra, tăng bộ đếm chưa đọc và cập nhật updated_at.
+    Dùng chung cho WebSocket (đồng bộ hoặc qua write-behind).
+    """
+    participant_ids = get_participant_ids(conversation_id)
+    message = ChatMessage.create_message(
+        conversation_id=uuid.UUID(str(conversation_id)),
+        sender_id=sender_id,
+        text=text,
+        participant_ids=participant_ids,
+        message_id=message_id,
+        message_timestamp=message_timestamp
+    )
+    record_message_sent(conversation_id, sender_id, participant_ids)
+    return message
+
+
+def record_message_sent(conversation_id, sender_id, participant_ids):
+    """
+    Tăng bộ đếm chưa đọc của người nhận và cập nhật updated_at sau khi lưu tin nhắn.
+    """
+    unread.increment_unread(
+        conversation_id,
+        [user_id for user_id in participant_ids if str(user_id) != str(sender_id)],
+        sender_id=sender_id
+    )
+    touch_conversation(conversation_id)
+
+
+def touch_conversation(conversation_id):
+    """
+    Đánh dấu cuộc trò chuyện vừa có tin nhắn mới. updated_at được ghi vào MySQL
+    theo lô (flush_conversation_activity); nếu Redis lỗi thì ghi trực tiếp.
+    """
+    if activity.touch(conversation_id):
+        return
+    try:
+        Conversation.objects.filter(id=uuid.UUID(str(conversation_id))).update(
+            updated_at=timezone.now()
+        )
+    except Exception as e:
+        # The message is already stored and counted; failing here would get it
+        # stored and counted again by a write-behind retry
+        logger.warning("Failed to update conversation activity: %s", e)
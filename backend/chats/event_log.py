@@ -0,0 +1,97 @@
+"""
+Per-conversation event sequence numbers and a short replay log.
+
+Every conversation broadcast except typing gets the next number of the
+Redis counter events:seq:<conversation_id> and is kept, already encoded, in
+the sorted set events:log:<conversation_id> scored by that number. A
+client that reconnects sends {"type": "resume", "last_seq": N} and gets
+the frames after N instead of re-fetching message pages. The log holds the
+last CHAT_EVENT_LOG_SIZE events for CHAT_EVENT_LOG_TTL seconds; when the
+requested range is gone the client is told to resync over REST.
+
+Clients should resume from the highest sequence up to which they have seen
+every number, since concurrent senders' events can arrive out of order.
+
+Sockets number their broadcasts in ChatConsumerBase.broadcast; changes made
+over REST go through publish, so they are numbered, logged and delivered
+the same way.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from core.redis_client import get_redis
+from .wire import encode_frame
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Assigns the sequence, splices it into the encoded frame and logs it.
+# The counter never expires so numbers are never reused.
+_APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+local frame = '{"seq":' .. seq .. ',' .. string.sub(ARGV[1], 2)
+redis.call('ZADD', KEYS[2], seq, frame)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return frame
+"""
+
+_append_script = None
+
+
+def conversation_group_name(conversation_id):
+    return f'conversation_{conversation_id}'
+
+
+def seq_key(conversation_id):
+    return f'events:seq:{conversation_id}'
+
+
+def log_key(conversation_id):
+    return f'events:log:{conversation_id}'
+
+
+def append(conversation_id, frame):
+    """Number and log an encoded frame (a JSON object); returns the frame with "seq" added"""
+    global _append_script
+    if _append_script is None:
+        _append_script = get_redis().register_script(_APPEND_SCRIPT)
+    return _append_script(
+        keys=[seq_key(conversation_id), log_key(conversation_id)],
+        args=[frame, settings.CHAT_EVENT_LOG_SIZE, settings.CHAT_EVENT_LOG_TTL]
+    )
+
+
+def publish(conversation_id, frame):
+    """Number, log and broadcast a frame from outside a socket (the REST views).
+
+    The change is already stored when this runs, so a failure is logged
+    rather than turned into an error response.
+    """
+    try:
+        text = append(conversation_id, encode_frame(frame))
+        async_to_sync(get_channel_layer().group_send)(
+            conversation_group_name(conversation_id),
+            {'type': 'forward_frame', 'frame': text}
+        )
+    except Exception as e:
+        logger.warning("Failed to publish %s event: %s", frame.get('type'), e)
+
+
+def current_seq(conversation_id):
+    return int(get_redis().get(seq_key(conversation_id)) or 0)
+
+
+def events_after(conversation_id, last_seq):
+    """(frames after last_seq, current seq), or (None, current seq) when some were trimmed"""
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.get(seq_key(conversation_id))
+    pipe.zrange(log_key(conversation_id), 0, 0, withscores=True)
+    pipe.zrangebyscore(log_key(conversation_id), f'({last_seq}', '+inf')
+    seq, oldest, frames = pipe.execute()
+    seq = int(seq or 0)
+    if last_seq >= seq:
+        return [], seq
+    if not oldest or oldest[0][1] > last_seq + 1:
+        return None, seq
+    return frames, seq
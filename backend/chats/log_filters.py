@@ -0,0 +1,26 @@
+"""
+Logging helpers for the chats app.
+
+Per-message debug lines go to the chats.messages logger. Its level gate is
+checked before any formatting happens, and when it is enabled the
+SamplingFilter (configured in settings.LOGGING) keeps only a fraction of
+the records so a busy server doesn't spend its time writing logs.
+"""
+import logging
+import random
+
+# Per-message/per-delivery debug lines, sampled
+message_logger = logging.getLogger('chats.messages')
+
+
+class SamplingFilter(logging.Filter):
+    """Let through roughly `rate` of the records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
@@ -0,0 +1,33 @@
+"""
+Cleanup shared by the benchmark commands.
+
+Writing a message also writes its counter, read watermark, search postings
+and (with participants) inbox summaries, and pinning writes the pin index.
+The benchmarks run against a real keyspace, so they delete all of it.
+"""
+from chats.cassandra_models import (
+    ChatMessage, BucketedChatMessage, ConversationBucket, ConversationSummary,
+    ConversationCounter, ConversationReadState, PinnedMessage, MessageSearchPosting, to_user_uuid
+)
+from chats.tokenizer import tokenize
+
+
+def delete_conversation_rows(conversation_id, user_ids=(), texts=()):
+    """Delete every row written for a benchmark conversation.
+
+    user_ids are the users whose inbox summary may hold the conversation,
+    texts the message texts used, whose terms have posting partitions.
+    """
+    for bucket in ConversationBucket.get_buckets(conversation_id):
+        BucketedChatMessage.objects.filter(conversation_id=conversation_id, bucket=bucket).delete()
+    ConversationBucket.objects.filter(conversation_id=conversation_id).delete()
+    ChatMessage.objects.filter(conversation_id=conversation_id).delete()
+    PinnedMessage.objects.filter(conversation_id=conversation_id).delete()
+    ConversationReadState.objects.filter(conversation_id=conversation_id).delete()
+    ConversationCounter.objects.filter(conversation_id=conversation_id).delete()
+    for term in {term for text in texts for term in tokenize(text)}:
+        MessageSearchPosting.objects.filter(conversation_id=conversation_id, term=term).delete()
+    for user_id in user_ids:
+        ConversationSummary.objects.filter(
+            user_id=to_user_uuid(user_id), conversation_id=conversation_id
+        ).delete()
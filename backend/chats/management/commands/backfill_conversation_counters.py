@@ -0,0 +1,78 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from chats.models import Conversation
+from chats.cassandra_models import (
+    ChatMessage, BucketedChatMessage, ConversationBucket, ConversationCounter, ConversationReadState
+)
+from chats import message_store
+
+
+class Command(BaseCommand):
+    help = ('Set conversation_counter to the number of stored messages of every conversation, '
+            'recompute the read_count of existing read watermarks and rebuild the unread counters. '
+            'Counts each conversation with a partition scan; run it off-peak.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', action='append', default=[],
+                            help='Only backfill these conversation IDs (repeatable)')
+        parser.add_argument('--skip-unread', action='store_true',
+                            help='Do not run reconcile_unread_counts afterwards')
+
+    def handle(self, *args, **options):
+        conversation_ids = options['conversation'] or list(
+            Conversation.objects.order_by('id').values_list('id', flat=True)
+        )
+        corrected = 0
+
+        self.stdout.write(f'Backfilling counters for {len(conversation_ids)} conversations...')
+        for index, conversation_id in enumerate(conversation_ids, 1):
+            message_count = self.count_messages(conversation_id)
+            # Counters can only be incremented, so add the difference
+            delta = message_count - ConversationCounter.get_count(conversation_id)
+            if delta:
+                message_store.execute(
+                    f"UPDATE {ConversationCounter.column_family_name()} "
+                    f"SET message_count = message_count + ? WHERE conversation_id = ?",
+                    (delta, conversation_id)
+                )
+                corrected += 1
+            self.recount_read_states(conversation_id, message_count)
+            if index % 500 == 0:
+                self.stdout.write(f'  {index}/{len(conversation_ids)} conversations processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfill complete: {corrected} counters corrected'))
+        if not options['skip_unread']:
+            call_command('reconcile_unread_counts', stdout=self.stdout)
+
+    def count_messages(self, conversation_id):
+        if ChatMessage.is_bucketed():
+            return sum(
+                BucketedChatMessage.objects.filter(conversation_id=conversation_id, bucket=bucket).count()
+                for bucket in ConversationBucket.get_buckets(conversation_id)
+            )
+        return ChatMessage.objects.filter(conversation_id=conversation_id).count()
+
+    def recount_read_states(self, conversation_id, message_count):
+        """Recompute read_count of watermarks written while the counter was behind.
+
+        Written one microsecond after the row's own write time so the update
+        applies without outranking later watermark moves.
+        """
+        rows = message_store.execute(
+            f"SELECT user_id, last_read_message_id, read_count, writetime(read_count) AS written "
+            f"FROM {ConversationReadState.column_family_name()} WHERE conversation_id = ?",
+            (conversation_id,)
+        )
+        for row in rows:
+            if row['last_read_message_id'] is None:
+                continue
+            read_count = max(
+                0, message_count - ChatMessage.count_newer_than(conversation_id, row['last_read_message_id'])
+            )
+            if read_count == row['read_count'] or row['written'] is None:
+                continue
+            message_store.execute(
+                f"UPDATE {ConversationReadState.column_family_name()} USING TIMESTAMP ? "
+                f"SET read_count = ? WHERE conversation_id = ? AND user_id = ?",
+                (row['written'] + 1, read_count, conversation_id, row['user_id'])
+            )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from chats.models import Conversation
+from chats.cassandra_models import ChatMessage, ConversationSummary
+
+
+class Command(BaseCommand):
+    help = 'Populate user_conversation_summary from the existing conversation_message table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of conversations processed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Conversation.objects.prefetch_related('participants').order_by('id')
+        total = queryset.count()
+        processed = 0
+        written = 0
+
+        self.stdout.write(f'Backfilling summaries for {total} conversations...')
+        for start in range(0, total, batch_size):
+            conversations = list(queryset[start:start + batch_size])
+            last_messages = ChatMessage.get_last_messages(
+                [conversation.id for conversation in conversations]
+            )
+
+            for conversation in conversations:
+                message = last_messages.get(conversation.id)
+                if message is None:
+                    continue
+                participant_ids = [user.id for user in conversation.participants.all()]
+                ConversationSummary.record_message(participant_ids, message)
+                written += 1
+
+            processed += len(conversations)
+            self.stdout.write(f'  {processed}/{total} conversations processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfill complete: {written} conversations summarized'))
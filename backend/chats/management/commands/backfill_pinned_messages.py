@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from chats.models import Conversation
+from chats.cassandra_models import (
+    ChatMessage, BucketedChatMessage, ConversationBucket, PinnedMessage
+)
+from chats import message_store
+
+
+class Command(BaseCommand):
+    help = ('Populate conversation_pinned_message from the is_pinned flags of existing messages. '
+            'Scans every conversation once with ALLOW FILTERING; run it off-peak.')
+
+    def handle(self, *args, **options):
+        conversation_ids = list(Conversation.objects.order_by('id').values_list('id', flat=True))
+        written = 0
+
+        self.stdout.write(f'Backfilling pins for {len(conversation_ids)} conversations...')
+        for index, conversation_id in enumerate(conversation_ids, 1):
+            for message in self.pinned_messages(conversation_id):
+                if message.pinned_at is None:
+                    continue
+                message_store.execute(*PinnedMessage.insert_statement(
+                    conversation_id, message.pinned_at, message.message_id, message.pinned_by
+                ))
+                written += 1
+            if index % 500 == 0:
+                self.stdout.write(f'  {index}/{len(conversation_ids)} conversations processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfill complete: {written} pinned messages indexed'))
+
+    def pinned_messages(self, conversation_id):
+        if ChatMessage.is_bucketed():
+            for bucket in ConversationBucket.get_buckets(conversation_id):
+                yield from BucketedChatMessage.objects.filter(
+                    conversation_id=conversation_id, bucket=bucket, is_pinned=True
+                ).allow_filtering()
+        else:
+            yield from ChatMessage.objects.filter(
+                conversation_id=conversation_id, is_pinned=True
+            ).allow_filtering()
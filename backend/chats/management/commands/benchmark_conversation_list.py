@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from chats.cassandra_models import ChatMessage
+from chats.management.benchmark_data import delete_conversation_rows
+import statistics
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Benchmark last-message lookup for the conversation list: one query per row vs. concurrent batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000',
+                            help='Comma separated numbers of conversations to benchmark')
+        parser.add_argument('--iterations', type=int, default=5,
+                            help='Number of timed runs per size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        iterations = options['iterations']
+        sender_id = uuid.uuid4()
+
+        self.stdout.write(f'{"conversations":>14} {"per-row (ms)":>14} {"batched (ms)":>14} {"speedup":>9}')
+        for size in sizes:
+            conversation_ids = [uuid.uuid4() for _ in range(size)]
+            for conversation_id in conversation_ids:
+                ChatMessage.create_message(conversation_id, sender_id, 'benchmark message')
+
+            try:
+                per_row = self.time_runs(iterations, lambda: self.per_row_lookup(conversation_ids))
+                batched = self.time_runs(iterations, lambda: ChatMessage.get_last_messages(conversation_ids))
+                self.stdout.write(
+                    f'{size:>14} {per_row:>14.1f} {batched:>14.1f} {per_row / batched:>8.1f}x'
+                )
+            finally:
+                for conversation_id in conversation_ids:
+                    delete_conversation_rows(conversation_id, texts=['benchmark message'])
+
+    def per_row_lookup(self, conversation_ids):
+        """The serializer's original behaviour: one blocking query per conversation"""
+        return {
+            conversation_id: list(ChatMessage.objects.filter(conversation_id=conversation_id).limit(1))
+            for conversation_id in conversation_ids
+        }
+
+    def time_runs(self, iterations, func):
+        """Return the median wall time of func in milliseconds"""
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from chats import wire
+from datetime import datetime
+import json
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = ('CPU time to turn one broadcast into N socket frames: json.dumps in every recipient '
+            'vs. encoding once on the sender and forwarding the text')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--text-length', type=int, default=200)
+
+    def handle(self, *args, **options):
+        conversation_id = str(uuid.uuid4())
+        events = [
+            {
+                'conversation_id': conversation_id,
+                'message': {
+                    'id': str(uuid.uuid1()),
+                    'sender_id': str(uuid.uuid4()),
+                    'text': 'x' * options['text_length'],
+                    'timestamp': datetime.now().isoformat(),
+                },
+            }
+            for _ in range(options['messages'])
+        ]
+
+        self.stdout.write(f'encoder: {wire.encoder_name()}')
+        self.stdout.write(f'{"group size":>10} {"per recipient (ms/msg)":>24} {"encode once (ms/msg)":>22} {"speedup":>8}')
+        for group_size in options['group_sizes']:
+            before = self.per_message_ms(events, lambda event: self.per_recipient(event, group_size))
+            after = self.per_message_ms(events, lambda event: self.encode_once(event, group_size))
+            self.stdout.write(f'{group_size:>10} {before:>24.3f} {after:>22.3f} {before / after:>7.1f}x')
+
+    def per_recipient(self, event, group_size):
+        """Old handlers: each recipient builds and encodes its own frame"""
+        for _ in range(group_size):
+            self.sink(json.dumps({
+                'type': 'message',
+                'conversation_id': event.get('conversation_id'),
+                'message': event['message']
+            }))
+
+    def encode_once(self, event, group_size):
+        frame = wire.encode_frame({
+            'type': 'message',
+            'conversation_id': event['conversation_id'],
+            'message': event['message']
+        })
+        for _ in range(group_size):
+            self.sink(frame)
+
+    def sink(self, text):
+        """Stands in for consumer.send(); keeps the call overhead in both variants"""
+        return len(text)
+
+    def per_message_ms(self, events, func):
+        start = time.process_time()
+        for event in events:
+            func(event)
+        return (time.process_time() - start) / len(events) * 1000
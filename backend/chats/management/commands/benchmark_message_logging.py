@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from chats.log_filters import message_logger
+from datetime import datetime
+import json
+import logging
+import sys
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = ('Messages per second through the send/deliver logging of the WebSocket hot path: '
+            'the old print statements vs. the chats loggers. No database is touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--fanout', type=int, default=10,
+                            help='Sockets each message is delivered to (one delivery log per socket)')
+
+    def handle(self, *args, **options):
+        conversation_id = str(uuid.uuid4())
+        sender_id = 42
+        messages = [
+            {
+                'id': str(uuid.uuid1()),
+                'sender_id': str(sender_id),
+                'text': f'benchmark message {index} ' * 5,
+                'timestamp': datetime.now().isoformat(),
+            }
+            for index in range(options['messages'])
+        ]
+
+        results = [
+            ('print', self.run(self.print_path, messages, conversation_id, sender_id, options['fanout'])),
+            (f'logging ({logging.getLevelName(message_logger.getEffectiveLevel())})',
+             self.run(self.logging_path, messages, conversation_id, sender_id, options['fanout'])),
+        ]
+        for name, rate in results:
+            self.stderr.write(f'{name:<20} {rate:>12,.0f} messages/s')
+
+    def run(self, path, messages, conversation_id, sender_id, fanout):
+        start = time.perf_counter()
+        for message in messages:
+            path(message, conversation_id, sender_id, fanout)
+        sys.stdout.flush()
+        return len(messages) / (time.perf_counter() - start)
+
+    def print_path(self, message, conversation_id, sender_id, fanout):
+        """The statements the consumer and ChatMessage used to print per message"""
+        print("===== DEBUG: Lưu và broadcast tin nhắn =====")
+        print(f"Nội dung tin nhắn: {message['text']}")
+        print(f"Creating message with sender_id UUID: {sender_id}")
+        print(f"Đã lưu tin nhắn với ID: {message['id']}")
+        event = {'type': 'chat_message', 'conversation_id': conversation_id, 'message': message}
+        print(f"Broadcast tin nhắn tới group conversation_{conversation_id}: {event}")
+        for _ in range(fanout):
+            print("===== DEBUG: Gửi tin nhắn tới WebSocket client =====")
+            print(f"Event: {event}")
+            message_data = {'type': 'message', 'conversation_id': conversation_id, 'message': message}
+            print(f"Data gửi đi: {message_data}")
+            json.dumps(message_data)
+
+    def logging_path(self, message, conversation_id, sender_id, fanout):
+        """The same points logged through the chats loggers"""
+        message_logger.debug("Saved message %s from user %s in conversation %s (%d chars)",
+                             message['id'], sender_id, conversation_id, len(message['text']))
+        for index in range(fanout):
+            message_logger.debug("Delivering message %s to %s", message['id'], index)
+            json.dumps({'type': 'message', 'conversation_id': conversation_id, 'message': message})
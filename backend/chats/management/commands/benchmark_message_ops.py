@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from chats.cassandra_models import ChatMessage
+from chats.management.benchmark_data import delete_conversation_rows
+from chats import message_store
+from datetime import datetime
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = ('Micro-benchmark per-operation CPU time of the message table writes: cqlengine vs. prepared '
+            'statements. Only the message row is written on both sides; the counter, read state, search '
+            'and pin index writes of the full helpers are left out.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    @override_settings(CHAT_MESSAGE_BUCKETING=False)
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        conversation_id = uuid.uuid4()
+        sender_id = uuid.uuid4()
+
+        try:
+            ids = []
+            cqlengine_create = self.cpu_time(iterations, lambda: ids.append(ChatMessage.create(
+                conversation_id=conversation_id, message_id=uuid.uuid1(), sender_id=sender_id, text='benchmark'
+            ).message_id))
+            prepared_create = self.cpu_time(iterations, lambda: ids.append(
+                self.prepared_insert(conversation_id, sender_id, 'benchmark')
+            ))
+
+            rows = [
+                ('create_message', cqlengine_create, prepared_create),
+                ('edit_message',
+                 self.cpu_time_over(ids, lambda mid: self.cqlengine_update(conversation_id, mid, text='edited', is_edited=True, edited_at=datetime.now())),
+                 self.cpu_time_over(ids, lambda mid: ChatMessage._update_message(conversation_id, mid, text='edited', is_edited=True, edited_at=datetime.now()))),
+                ('pin_message',
+                 self.cpu_time_over(ids, lambda mid: self.cqlengine_update(conversation_id, mid, is_pinned=True, pinned_at=datetime.now(), pinned_by=sender_id)),
+                 self.cpu_time_over(ids, lambda mid: self.prepared_update(conversation_id, mid, is_pinned=True, pinned_at=datetime.now(), pinned_by=sender_id))),
+            ]
+        finally:
+            delete_conversation_rows(conversation_id, user_ids=[sender_id], texts=['benchmark', 'edited'])
+
+        self.stdout.write(f'{"operation":<16} {"cqlengine (us)":>15} {"prepared (us)":>15}')
+        for name, before, after in rows:
+            self.stdout.write(f'{name:<16} {before:>15.1f} {after:>15.1f}')
+
+    def cqlengine_update(self, conversation_id, message_id, **changes):
+        """The original helpers: model query, attribute changes, full save()"""
+        message = ChatMessage.objects.get(conversation_id=conversation_id, message_id=message_id)
+        for name, value in changes.items():
+            setattr(message, name, value)
+        message.save()
+
+    def prepared_insert(self, conversation_id, sender_id, text):
+        """The insert of create_message without the writes that follow it"""
+        fields = ChatMessage._new_message_fields(conversation_id, sender_id, text, False, None, None)
+        return message_store.insert(ChatMessage, fields).message_id
+
+    def prepared_update(self, conversation_id, message_id, **changes):
+        """Read then write the row, like cqlengine_update, with prepared statements"""
+        key = ChatMessage.message_key(conversation_id, message_id)
+        message_store.select_one(ChatMessage, key)
+        message_store.update(ChatMessage, key, changes)
+
+    def cpu_time(self, iterations, func):
+        """Average process CPU time of func in microseconds"""
+        start = time.process_time()
+        for _ in range(iterations):
+            func()
+        return (time.process_time() - start) / iterations * 1_000_000
+
+    def cpu_time_over(self, values, func):
+        start = time.process_time()
+        for value in values:
+            func(value)
+        return (time.process_time() - start) / len(values) * 1_000_000
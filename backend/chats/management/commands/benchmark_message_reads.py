@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from cassandra.util import uuid_from_time
+from chats.message_store import execute_concurrently
+from chats.cassandra_models import (
+    ChatMessage, BucketedChatMessage, ConversationBucket, message_bucket
+)
+from datetime import datetime, timedelta
+import random
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Benchmark get_messages read latency on one large conversation, flat vs. time-bucketed layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5_000_000,
+                            help='Number of messages to seed in the conversation')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Time span the seeded messages are spread over')
+        parser.add_argument('--reads', type=int, default=1000,
+                            help='Number of timed get_messages calls per layout')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--layout', choices=['flat', 'bucketed', 'both'], default='both')
+        parser.add_argument('--conversation', help='Reuse an already seeded conversation ID (skips seeding)')
+        parser.add_argument('--concurrency', type=int, default=200)
+
+    def handle(self, *args, **options):
+        layouts = ['flat', 'bucketed'] if options['layout'] == 'both' else [options['layout']]
+        if options['conversation']:
+            conversation_id = uuid.UUID(options['conversation'])
+            cursors = None
+        else:
+            conversation_id = uuid.uuid4()
+            cursors = self.seed(conversation_id, layouts, options)
+            self.stdout.write(f'Seeded conversation {conversation_id}')
+
+        for layout in layouts:
+            with override_settings(CHAT_MESSAGE_BUCKETING=(layout == 'bucketed')):
+                if cursors is None:
+                    cursors = [m.message_id for m in ChatMessage.get_messages(conversation_id, limit=1000)]
+                self.report(layout, conversation_id, cursors, options)
+
+    def seed(self, conversation_id, layouts, options):
+        """Insert messages spread evenly over the time span; returns a sample of IDs to use as cursors"""
+        total = options['messages']
+        start = datetime.now() - timedelta(days=options['days'])
+        step = timedelta(days=options['days']) / total
+        sender_id = uuid.uuid4()
+
+        flat_cql = (f"INSERT INTO {ChatMessage.column_family_name()} "
+                    f"(conversation_id, message_id, sender_id, text, message_timestamp) VALUES (?, ?, ?, ?, ?)")
+        bucketed_cql = (f"INSERT INTO {BucketedChatMessage.column_family_name()} "
+                        f"(conversation_id, bucket, message_id, sender_id, text, message_timestamp) "
+                        f"VALUES (?, ?, ?, ?, ?, ?)")
+
+        cursors = []
+        buckets = set()
+        chunk_size = 10000
+        for offset in range(0, total, chunk_size):
+            flat_params, bucketed_params = [], []
+            for index in range(offset, min(offset + chunk_size, total)):
+                timestamp = start + step * index
+                message_id = uuid_from_time(timestamp)
+                text = f'benchmark message {index}'
+                flat_params.append((conversation_id, message_id, sender_id, text, timestamp))
+                bucket = message_bucket(timestamp)
+                buckets.add(bucket)
+                bucketed_params.append((conversation_id, bucket, message_id, sender_id, text, timestamp))
+                if random.random() < 1000 / total:
+                    cursors.append(message_id)
+
+            if 'flat' in layouts:
+                execute_concurrently(flat_cql, flat_params, concurrency=options['concurrency'])
+            if 'bucketed' in layouts:
+                execute_concurrently(bucketed_cql, bucketed_params, concurrency=options['concurrency'])
+            self.stdout.write(f'  seeded {min(offset + chunk_size, total)}/{total}')
+
+        for bucket in buckets:
+            ConversationBucket.record(conversation_id, bucket)
+        return cursors
+
+    def report(self, layout, conversation_id, cursors, options):
+        latest, paged = [], []
+        for _ in range(options['reads']):
+            start = time.perf_counter()
+            ChatMessage.get_messages(conversation_id, limit=options['page_size'])
+            latest.append((time.perf_counter() - start) * 1000)
+
+            cursor = random.choice(cursors) if cursors else None
+            start = time.perf_counter()
+            ChatMessage.get_messages(conversation_id, limit=options['page_size'], last_message_id=cursor)
+            paged.append((time.perf_counter() - start) * 1000)
+
+        for name, timings in (('latest page', latest), ('cursor page', paged)):
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            self.stdout.write(f'{layout:>9} {name:<12} p50={p50:.2f}ms p99={p99:.2f}ms')
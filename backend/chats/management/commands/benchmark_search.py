@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from chats.cassandra_models import ChatMessage, MessageSearchPosting
+from chats.search import search_messages
+import random
+import time
+import uuid
+
+WORDS = [
+    'hello', 'meeting', 'tomorrow', 'project', 'deadline', 'lunch', 'coffee', 'report',
+    'review', 'release', 'bug', 'fix', 'deploy', 'server', 'database', 'weekend',
+    'photo', 'trip', 'birthday', 'party', 'call', 'later', 'thanks', 'invoice',
+]
+
+
+class Command(BaseCommand):
+    help = 'Query latency of message search over synthetic conversations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=20)
+        parser.add_argument('--messages', type=int, default=500, help='messages per conversation')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--terms', type=int, nargs='+', default=[1, 2, 3])
+
+    @override_settings(CHAT_MESSAGE_BUCKETING=False, CHAT_SEARCH_INDEXING=True)
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        conversation_ids = [uuid.uuid4() for _ in range(options['conversations'])]
+        sender_id = uuid.uuid4()
+
+        try:
+            self.stdout.write(f'Creating {len(conversation_ids) * options["messages"]} messages...')
+            for conversation_id in conversation_ids:
+                for _ in range(options['messages']):
+                    ChatMessage.create_message(
+                        conversation_id, sender_id, ' '.join(rng.choices(WORDS, k=rng.randint(3, 15)))
+                    )
+
+            self.stdout.write(f'{"terms":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"avg hits":>9}')
+            for term_count in options['terms']:
+                latencies, hit_counts = [], []
+                for _ in range(options['queries']):
+                    query = ' '.join(rng.sample(WORDS, term_count))
+                    start = time.perf_counter()
+                    hits, _ = search_messages(conversation_ids, query, limit=20)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hit_counts.append(len(hits))
+                latencies.sort()
+                self.stdout.write(
+                    f'{term_count:>6} {self.percentile(latencies, 0.5):>8.1f} '
+                    f'{self.percentile(latencies, 0.95):>8.1f} {self.percentile(latencies, 0.99):>8.1f} '
+                    f'{sum(hit_counts) / len(hit_counts):>9.1f}'
+                )
+        finally:
+            for conversation_id in conversation_ids:
+                ChatMessage.objects.filter(conversation_id=conversation_id).delete()
+                for word in WORDS:
+                    MessageSearchPosting.objects.filter(conversation_id=conversation_id, term=word).delete()
+
+    def percentile(self, values, fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))]
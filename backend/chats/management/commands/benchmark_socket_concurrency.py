@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from channels.db import database_sync_to_async
+from chats.cassandra_models import ChatMessage
+from chats.management.benchmark_data import delete_conversation_rows
+import asyncio
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = ('Concurrent sockets one worker process can serve: every simulated socket saves messages '
+            'back to back through database_sync_to_async (before) or the execute_async adapter (after)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, nargs='+', default=[10, 100, 500, 1000])
+        parser.add_argument('--messages', type=int, default=20, help='messages per socket')
+        parser.add_argument('--target-ms', type=float, default=100.0,
+                            help='p99 save latency a socket count must stay under to count as served')
+
+    @override_settings(CHAT_MESSAGE_BUCKETING=False)
+    def handle(self, *args, **options):
+        conversation_id = uuid.uuid4()
+        sender_id = uuid.uuid4()
+        threaded_save = database_sync_to_async(ChatMessage.create_message)
+
+        paths = {
+            'threadpool': lambda: threaded_save(conversation_id, sender_id, 'benchmark'),
+            'async': lambda: ChatMessage.acreate_message(conversation_id, sender_id, 'benchmark'),
+        }
+        served = {name: 0 for name in paths}
+
+        try:
+            self.stdout.write(f'{"sockets":>8} {"path":<11} {"msgs/s":>9} {"p50 ms":>8} {"p99 ms":>8}')
+            for sockets in options['sockets']:
+                for name, save in paths.items():
+                    throughput, p50, p99 = asyncio.run(self.run(save, sockets, options['messages']))
+                    self.stdout.write(f'{sockets:>8} {name:<11} {throughput:>9.0f} {p50:>8.1f} {p99:>8.1f}')
+                    if p99 <= options['target_ms']:
+                        served[name] = max(served[name], sockets)
+        finally:
+            delete_conversation_rows(conversation_id, texts=['benchmark'])
+
+        for name, sockets in served.items():
+            self.stdout.write(f'{name}: {sockets} sockets per worker at p99 <= {options["target_ms"]:.0f} ms')
+
+    async def run(self, save, sockets, messages):
+        latencies = []
+
+        async def socket():
+            for _ in range(messages):
+                start = time.perf_counter()
+                await save()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(socket() for _ in range(sockets)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        return len(latencies) / elapsed, p50, p99
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from chats import access_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit rates of the WebSocket user and membership caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        for name, stats in access_cache.get_stats().items():
+            hit_rate = 'n/a' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+            self.stdout.write(f"{name:<14} hits={stats['hits']:<10} misses={stats['misses']:<10} hit_rate={hit_rate}")
+        if options['reset']:
+            access_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
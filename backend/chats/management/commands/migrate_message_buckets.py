@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from chats.models import Conversation
+from chats.message_store import execute_concurrently
+from chats.cassandra_models import (
+    ChatMessage, BucketedChatMessage, ConversationBucket, message_bucket
+)
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Rewrite conversation_message rows into the time-bucketed conversation_message_by_bucket layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', action='append', default=[],
+                            help='Only migrate this conversation ID (can be repeated)')
+        parser.add_argument('--fetch-size', type=int, default=1000,
+                            help='Rows read per page from the source partition')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Concurrent inserts into the bucketed table')
+
+    def handle(self, *args, **options):
+        if options['conversation']:
+            conversation_ids = [uuid.UUID(cid) for cid in options['conversation']]
+        else:
+            conversation_ids = list(Conversation.objects.values_list('id', flat=True))
+
+        column_names = list(ChatMessage._columns.keys())
+        insert_cql = (
+            f"INSERT INTO {BucketedChatMessage.column_family_name()} "
+            f"(bucket, {', '.join(column_names)}) "
+            f"VALUES (?, {', '.join('?' for _ in column_names)})"
+        )
+
+        total = 0
+        for index, conversation_id in enumerate(conversation_ids, start=1):
+            migrated = self.migrate_conversation(
+                conversation_id, column_names, insert_cql,
+                options['fetch_size'], options['concurrency']
+            )
+            total += migrated
+            self.stdout.write(f'[{index}/{len(conversation_ids)}] {conversation_id}: {migrated} messages')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrated {total} messages. Set CHAT_MESSAGE_BUCKETING=True to serve reads from the new layout; '
+            f'the conversation_message table is left untouched.'
+        ))
+
+    def migrate_conversation(self, conversation_id, column_names, insert_cql, fetch_size, concurrency):
+        rows = ChatMessage.objects.filter(conversation_id=conversation_id).fetch_size(fetch_size)
+
+        migrated = 0
+        buckets = set()
+        pending = []
+        for row in rows:
+            bucket = message_bucket(row.message_timestamp)
+            buckets.add(bucket)
+            pending.append((bucket,) + tuple(getattr(row, name) for name in column_names))
+            if len(pending) >= fetch_size:
+                migrated += self.flush(insert_cql, pending, concurrency)
+                pending = []
+        if pending:
+            migrated += self.flush(insert_cql, pending, concurrency)
+
+        for bucket in buckets:
+            ConversationBucket.record(conversation_id, bucket)
+        return migrated
+
+    def flush(self, insert_cql, params_list, concurrency):
+        results = execute_concurrently(insert_cql, params_list, concurrency=concurrency)
+        failures = [result for success, result in results if not success]
+        for error in failures[:3]:
+            self.stdout.write(self.style.WARNING(f'  insert failed: {error}'))
+        return len(params_list) - len(failures)
@@ -0,0 +1,174 @@
+from django.core.management.base import BaseCommand, CommandError
+from cassandra.util import uuid_from_time
+from chats.models import Conversation, Attachment
+from chats import message_store
+from chats.message_store import execute_concurrently
+from chats.cassandra_models import (
+    ChatMessage, ConversationBucket, ConversationSummary, ConversationReadState,
+    MessageSearchPosting, PinnedMessage
+)
+from chats.conversation_utils import get_participant_ids
+from chats.tokenizer import term_counts
+from core.redis_client import get_redis
+from types import SimpleNamespace
+import uuid
+
+
+# Set once no conversation holds legacy IDs, so later --check runs are a single read
+MIGRATED_KEY = 'chats:message_ids_migrated'
+
+
+class Command(BaseCommand):
+    help = ('Rewrite messages with random (version 4) IDs to TimeUUIDs derived from their timestamp. '
+            'Required before serving traffic: legacy IDs sort above every TimeUUID, so they show up as '
+            'the newest messages and count as unread. --check fails while any are left.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', action='append', default=[],
+                            help='Only migrate this conversation ID (can be repeated)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the messages that would be rewritten')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with an error if any conversation still has legacy IDs')
+
+    def handle(self, *args, **options):
+        if options['conversation']:
+            conversation_ids = [uuid.UUID(cid) for cid in options['conversation']]
+        else:
+            conversation_ids = list(Conversation.objects.values_list('id', flat=True))
+
+        if options['check']:
+            self.check_migrated(conversation_ids, options)
+            return
+
+        model = ChatMessage.message_model()
+        key_names = list(model._primary_keys.keys())
+        column_names = list(model._columns.keys())
+        insert_cql = (
+            f"INSERT INTO {model.column_family_name()} ({', '.join(column_names)}) "
+            f"VALUES ({', '.join('?' for _ in column_names)})"
+        )
+        delete_cql = (
+            f"DELETE FROM {model.column_family_name()} "
+            f"WHERE {' AND '.join(f'{name} = ?' for name in key_names)}"
+        )
+
+        total = 0
+        for index, conversation_id in enumerate(conversation_ids, start=1):
+            legacy_rows = [row for row in self.iter_messages(model, conversation_id) if row.message_id.version != 1]
+            self.stdout.write(f'[{index}/{len(conversation_ids)}] {conversation_id}: {len(legacy_rows)} legacy messages')
+            total += len(legacy_rows)
+            if options['dry_run'] or not legacy_rows:
+                continue
+
+            id_map = {row.message_id: uuid_from_time(row.message_timestamp) for row in legacy_rows}
+
+            # Write the new rows before removing anything
+            inserts = []
+            for row in legacy_rows:
+                values = {name: getattr(row, name) for name in column_names}
+                values['message_id'] = id_map[row.message_id]
+                inserts.append(tuple(values[name] for name in column_names))
+            self.check(execute_concurrently(insert_cql, inserts, concurrency=options['concurrency']))
+
+            # Attachments reference messages by ID in MySQL
+            attached_ids = set(
+                Attachment.objects.filter(conversation_id=conversation_id).values_list('message_id', flat=True)
+            )
+            for old_id in attached_ids & id_map.keys():
+                Attachment.objects.filter(message_id=old_id).update(message_id=id_map[old_id])
+
+            # Pins, search postings and read watermarks also hold message IDs
+            self.rewrite_pins(legacy_rows, id_map, options['concurrency'])
+            self.rewrite_postings(legacy_rows, id_map)
+            self.rewrite_read_states(conversation_id, id_map)
+
+            deletes = [tuple(getattr(row, name) for name in key_names) for row in legacy_rows]
+            self.check(execute_concurrently(delete_cql, deletes, concurrency=options['concurrency']))
+
+            # Inbox summaries may still point at an old ID
+            last_message = ChatMessage.get_last_messages([conversation_id]).get(conversation_id)
+            if last_message is not None:
+                ConversationSummary.record_message(get_participant_ids(conversation_id), last_message)
+
+        verb = 'would be rewritten' if options['dry_run'] else 'rewritten'
+        self.stdout.write(self.style.SUCCESS(f'{total} messages {verb}'))
+        if not options['dry_run'] and not options['conversation']:
+            get_redis().set(MIGRATED_KEY, 1)
+
+    def check_migrated(self, conversation_ids, options):
+        if not options['conversation'] and get_redis().exists(MIGRATED_KEY):
+            self.stdout.write(self.style.SUCCESS('Message IDs already migrated'))
+            return
+        legacy = ChatMessage.legacy_id_conversations(conversation_ids, concurrency=options['concurrency'])
+        if legacy:
+            raise CommandError(
+                f'{len(legacy)} conversations still have legacy message IDs; '
+                f'run "manage.py migrate_message_ids" before serving traffic'
+            )
+        if not options['conversation']:
+            get_redis().set(MIGRATED_KEY, 1)
+        self.stdout.write(self.style.SUCCESS(f'No legacy message IDs in {len(conversation_ids)} conversations'))
+
+    def rewrite_pins(self, legacy_rows, id_map, concurrency):
+        pinned = [row for row in legacy_rows if row.is_pinned and row.pinned_at is not None]
+        if not pinned:
+            return
+        self.execute_statements([
+            PinnedMessage.insert_statement(row.conversation_id, row.pinned_at, id_map[row.message_id], row.pinned_by)
+            for row in pinned
+        ], concurrency)
+        self.execute_statements([
+            PinnedMessage.delete_statement(row.conversation_id, row.pinned_at, row.message_id)
+            for row in pinned
+        ], concurrency)
+
+    def rewrite_postings(self, legacy_rows, id_map):
+        old_postings = []
+        for row in legacy_rows:
+            if row.is_deleted:
+                continue
+            MessageSearchPosting.index_message(SimpleNamespace(
+                conversation_id=row.conversation_id, message_id=id_map[row.message_id], text=row.text
+            ))
+            old_postings.extend((row.conversation_id, term, row.message_id) for term in term_counts(row.text))
+        if old_postings:
+            MessageSearchPosting.remove(old_postings)
+
+    def rewrite_read_states(self, conversation_id, id_map):
+        """Point watermarks at the new IDs.
+
+        The old rows were written with the wall-clock time as write
+        timestamp, so the rewrite has to be newer than that to apply.
+        """
+        rows = message_store.execute(
+            f"SELECT user_id, last_read_message_id, read_count, read_at, writetime(last_read_message_id) AS written "
+            f"FROM {ConversationReadState.column_family_name()} WHERE conversation_id = ?",
+            (conversation_id,)
+        )
+        for row in rows:
+            new_id = id_map.get(row['last_read_message_id'])
+            if new_id is None:
+                continue
+            message_store.execute(ConversationReadState.mark_read_cql(), (
+                conversation_id, row['user_id'], new_id, row['read_count'], row['read_at'], row['written'] + 1
+            ))
+
+    def iter_messages(self, model, conversation_id):
+        if ChatMessage.is_bucketed():
+            for bucket in ConversationBucket.get_buckets(conversation_id):
+                yield from model.objects.filter(conversation_id=conversation_id, bucket=bucket).fetch_size(1000)
+        else:
+            yield from model.objects.filter(conversation_id=conversation_id).fetch_size(1000)
+
+    def execute_statements(self, statements, concurrency):
+        """Run (cql, params) statements that share one CQL string"""
+        self.check(execute_concurrently(
+            statements[0][0], [params for _, params in statements], concurrency=concurrency
+        ))
+
+    def check(self, results):
+        failures = [result for success, result in results if not success]
+        if failures:
+            raise RuntimeError(f'{len(failures)} statements failed, first error: {failures[0]}')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from chats.models import Conversation
+from chats.cassandra_models import ChatMessage, MessageSearchPosting
+from chats import message_store
+
+
+class Command(BaseCommand):
+    help = 'Rebuild message_search_posting from the stored messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', action='append', default=[],
+                            help='Only rebuild these conversation IDs (repeatable)')
+        parser.add_argument('--truncate', action='store_true',
+                            help='Empty the index first instead of overwriting postings in place')
+        parser.add_argument('--page-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['truncate']:
+            message_store.execute(f"TRUNCATE {MessageSearchPosting.column_family_name()}")
+
+        conversation_ids = options['conversation'] or list(
+            Conversation.objects.order_by('id').values_list('id', flat=True)
+        )
+        indexed = 0
+
+        self.stdout.write(f'Indexing {len(conversation_ids)} conversations...')
+        for index, conversation_id in enumerate(conversation_ids, 1):
+            last_message_id = None
+            while True:
+                messages = ChatMessage.get_messages(
+                    conversation_id, limit=options['page_size'], last_message_id=last_message_id
+                )
+                for message in messages:
+                    if not message.is_deleted:
+                        MessageSearchPosting.index_message(message)
+                        indexed += 1
+                if len(messages) < options['page_size']:
+                    break
+                last_message_id = messages[-1].message_id
+            if index % 100 == 0:
+                self.stdout.write(f'  {index}/{len(conversation_ids)} conversations indexed')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuild complete: {indexed} messages indexed'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from chats.models import Conversation
+from chats.cassandra_models import ConversationCounter, ConversationReadState
+from chats import unread
+from collections import defaultdict
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis unread counters from the Cassandra read watermarks'
+
+    def handle(self, *args, **options):
+        counts_by_user = defaultdict(dict)
+        conversations = Conversation.objects.prefetch_related('participants')
+        total = conversations.count()
+
+        for index, conversation in enumerate(conversations.iterator(chunk_size=500), start=1):
+            participant_ids = [user.id for user in conversation.participants.all()]
+            states = ConversationReadState.get_for_conversation(conversation.id)
+            # Messages after each watermark, as unread.increment_unread and
+            # set_unread count them; sent messages move the sender's watermark
+            counts = ConversationReadState.unread_counts(
+                participant_ids, states, ConversationCounter.get_count(conversation.id)
+            )
+            for user_id, count in counts.items():
+                counts_by_user[user_id][conversation.id] = count
+            if index % 500 == 0:
+                self.stdout.write(f'  {index}/{total} conversations processed')
+
+        unread.replace_unread_counts(counts_by_user)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt unread counters for {len(counts_by_user)} users from {total} conversations'
+        ))
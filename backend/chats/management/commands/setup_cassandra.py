@@ -60,15 +60,15 @@ class Command(BaseCommand):
                 connection.setup(hosts, keyspace, protocol_version=4)
                 
                 # Đồng bộ các bảng
-                self.stdout.write('Đồng bộ bảng conversation_message...')
-                # Đảm bảo table_name khớp
-                from chats.cassandra_models import ChatMessage
-                table_name = getattr(ChatMessage, '__table_name__', None)
-                self.stdout.write(f'Tên bảng trong model: {table_name}')
-                sync_table(ChatMessage)
-                
-                # Kiểm tra bảng đã được tạo chưa
-                self.check_table_exists(keyspace, table_name)
+                from chats.cassandra_models import CASSANDRA_MODELS
+                for model in CASSANDRA_MODELS:
+                    # Đảm bảo table_name khớp
+                    table_name = getattr(model, '__table_name__', None)
+                    self.stdout.write(f'Đồng bộ bảng {table_name}...')
+                    sync_table(model)
+                    
+                    # Kiểm tra bảng đã được tạo chưa
+                    self.check_table_exists(keyspace, table_name)
                 
                 self.stdout.write(self.style.SUCCESS('Thiết lập Cassandra hoàn tất thành công!'))
                 return
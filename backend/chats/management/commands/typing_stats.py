@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from chats import typing_indicators
+
+
+class Command(BaseCommand):
+    help = 'Show how many typing frames were broadcast vs. suppressed by coalescing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = typing_indicators.get_stats()
+        ratio = stats['suppressed'] / stats['received'] if stats['received'] else 0
+        self.stdout.write(
+            f"received={stats['received']} sent={stats['sent']} "
+            f"suppressed={stats['suppressed']} ({ratio:.1%})"
+        )
+        if options['reset']:
+            typing_indicators.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,224 @@
+"""
+Prepared-statement data access for the ChatMessage hot path.
+
+cqlengine builds a query object (and renders its CQL) on every call. The
+helpers here render and prepare each statement once per process and only
+bind parameters per call. They take the model classes from cassandra_models
+and return model instances, so callers keep the same return shapes.
+
+The a-prefixed coroutines run the same statements through the driver's
+execute_async, resolved on the event loop by the driver's IO thread, so
+the WebSocket consumers don't hold a threadpool worker per query.
+"""
+from cassandra.cqlengine import connection
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType
+import asyncio
+
+# Prepared statements, one per CQL string per process
+_prepared_statements = {}
+
+# Rendered CQL per (operation, model, columns)
+_cql_cache = {}
+
+
+def prepare(cql):
+    """Prepare a statement once per process"""
+    statement = _prepared_statements.get(cql)
+    if statement is None:
+        statement = _prepared_statements[cql] = connection.get_session().prepare(cql)
+    return statement
+
+
+def forget_prepared_statements():
+    """Drop statements prepared on a session that is being replaced"""
+    _prepared_statements.clear()
+
+
+def execute(cql, params=()):
+    """Execute a prepared statement synchronously"""
+    return connection.get_session().execute(prepare(cql), params)
+
+
+async def aexecute(cql, params=()):
+    """Execute a prepared statement without blocking the event loop"""
+    return await _wrap_future(connection.get_session().execute_async(prepare(cql), params))
+
+
+def _logged_batch(statements):
+    batch = BatchStatement(batch_type=BatchType.LOGGED)
+    for cql, params in statements:
+        batch.add(prepare(cql), params)
+    return batch
+
+
+def execute_batch(statements):
+    """Apply several (cql, params) statements atomically as a logged batch"""
+    return connection.get_session().execute(_logged_batch(statements))
+
+
+async def aexecute_batch(statements):
+    return await _wrap_future(connection.get_session().execute_async(_logged_batch(statements)))
+
+
+def _wrap_future(response_future):
+    """Turn a driver ResponseFuture into an awaitable asyncio future.
+
+    Callbacks run on the driver's IO thread; the result is handed to the
+    loop with call_soon_threadsafe. The final result is already set when
+    the callback fires, so result() doesn't block there.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def on_success(_rows):
+        loop.call_soon_threadsafe(_resolve, future, response_future.result())
+
+    def on_error(exc):
+        loop.call_soon_threadsafe(_reject, future, exc)
+
+    response_future.add_callbacks(on_success, on_error)
+    return future
+
+
+def _resolve(future, result):
+    if not future.cancelled():
+        future.set_result(result)
+
+
+def _reject(future, exc):
+    if not future.cancelled():
+        future.set_exception(exc)
+
+
+def execute_concurrently(cql, params_list, concurrency=50):
+    """Run one prepared statement for many parameter tuples concurrently.
+
+    Returns a list of (success, result_or_exception) in the order of params_list.
+    """
+    return execute_concurrent_with_args(
+        connection.get_session(),
+        prepare(cql),
+        params_list,
+        concurrency=concurrency,
+        raise_on_first_error=False
+    )
+
+
+def _key_clause(model):
+    return ' AND '.join(f'{name} = ?' for name in model._primary_keys)
+
+
+def insert_cql(model, column_names):
+    cache_key = ('insert', model, column_names)
+    cql = _cql_cache.get(cache_key)
+    if cql is None:
+        cql = _cql_cache[cache_key] = (
+            f"INSERT INTO {model.column_family_name()} ({', '.join(column_names)}) "
+            f"VALUES ({', '.join('?' for _ in column_names)})"
+        )
+    return cql
+
+
+def select_cql(model):
+    cache_key = ('select', model)
+    cql = _cql_cache.get(cache_key)
+    if cql is None:
+        cql = _cql_cache[cache_key] = (
+            f"SELECT * FROM {model.column_family_name()} WHERE {_key_clause(model)}"
+        )
+    return cql
+
+
+def update_cql(model, column_names, if_exists=False):
+    cache_key = ('update', model, column_names, if_exists)
+    cql = _cql_cache.get(cache_key)
+    if cql is None:
+        assignments = ', '.join(f'{name} = ?' for name in column_names)
+        cql = _cql_cache[cache_key] = (
+            f"UPDATE {model.column_family_name()} SET {assignments} WHERE {_key_clause(model)}"
+            f"{' IF EXISTS' if if_exists else ''}"
+        )
+    return cql
+
+
+def _key_params(model, key):
+    return tuple(key[name] for name in model._primary_keys)
+
+
+def _with_defaults(model, values):
+    values = dict(values)
+    for name, column in model._columns.items():
+        if name not in values and column.has_default:
+            values[name] = column.get_default()
+    return values
+
+
+def insert(model, values):
+    """Insert a row, filling in column defaults like Model.create does"""
+    values = _with_defaults(model, values)
+    column_names = tuple(values)
+    execute(insert_cql(model, column_names), tuple(values[name] for name in column_names))
+    return model._construct_instance(values)
+
+
+async def ainsert(model, values):
+    values = _with_defaults(model, values)
+    column_names = tuple(values)
+    await aexecute(insert_cql(model, column_names), tuple(values[name] for name in column_names))
+    return model._construct_instance(values)
+
+
+def select_one(model, key):
+    """Fetch a row by its full primary key, None if it doesn't exist"""
+    for row in execute(select_cql(model), _key_params(model, key)):
+        return model._construct_instance(row)
+    return None
+
+
+async def aselect_one(model, key):
+    for row in await aexecute(select_cql(model), _key_params(model, key)):
+        return model._construct_instance(row)
+    return None
+
+
+def select_many(model, keys, concurrency=50):
+    """Fetch rows by full primary key concurrently, in the order of keys.
+
+    Missing rows and failed reads are skipped.
+    """
+    results = execute_concurrently(
+        select_cql(model), [_key_params(model, key) for key in keys], concurrency=concurrency
+    )
+    rows = []
+    for success, result in results:
+        if success:
+            rows.extend(model._construct_instance(row) for row in result)
+    return rows
+
+
+def update_statement(model, key, changes):
+    """(cql, params) of a blind update, for use in a batch"""
+    column_names = tuple(changes)
+    params = tuple(changes[name] for name in column_names) + _key_params(model, key)
+    return update_cql(model, column_names), params
+
+
+def update(model, key, changes, if_exists=False):
+    """Set some columns of a row identified by its full primary key.
+
+    A blind write by default. With if_exists the update is a lightweight
+    transaction that only applies to an existing row. Returns whether the
+    update was applied.
+    """
+    column_names = tuple(changes)
+    params = tuple(changes[name] for name in column_names) + _key_params(model, key)
+    result = execute(update_cql(model, column_names, if_exists), params)
+    return result.was_applied if if_exists else True
+
+
+async def aupdate(model, key, changes, if_exists=False):
+    column_names = tuple(changes)
+    params = tuple(changes[name] for name in column_names) + _key_params(model, key)
+    result = await aexecute(update_cql(model, column_names, if_exists), params)
+    return result.was_applied if if_exists else True
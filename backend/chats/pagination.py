@@ -0,0 +1,45 @@
+"""
+Opaque page tokens for the messages endpoint.
+
+Message IDs are TimeUUIDs clustered newest first, so a page is a keyset
+range read from a boundary message: "older" pages read below it, "newer"
+pages (catch-up after a reconnect) read above it. A token is that
+direction and boundary, base64-encoded so clients treat it as opaque.
+"""
+from django.conf import settings
+import base64
+import uuid
+
+OLDER = 'older'
+NEWER = 'newer'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, message_id):
+    raw = f'{direction}:{message_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(direction, boundary message UUID) of a token, raises InvalidCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, message_id = raw.split(':', 1)
+        message_id = uuid.UUID(message_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+    if direction not in (OLDER, NEWER):
+        raise InvalidCursor('Invalid cursor')
+    return direction, message_id
+
+
+def page_size(requested):
+    """Requested page size clamped to CHAT_MESSAGES_MAX_PAGE_SIZE"""
+    try:
+        size = int(requested) if requested else settings.CHAT_MESSAGES_PAGE_SIZE
+    except (TypeError, ValueError):
+        size = settings.CHAT_MESSAGES_PAGE_SIZE
+    return max(1, min(size, settings.CHAT_MESSAGES_MAX_PAGE_SIZE))
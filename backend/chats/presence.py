@@ -0,0 +1,176 @@
+"""
+Redis-backed user presence.
+
+Each open socket is a member of the sorted set presence:conns:<user_id>,
+scored by the time its lease expires. The consumer renews the lease every
+PRESENCE_RENEW_INTERVAL seconds while the socket is open, and on explicit
+heartbeat frames. A user is online while the set has a live member, so
+several tabs or conversation sockets count as one presence and a crashed
+server's sockets simply age out.
+
+last_active is kept in Redis and written to MySQL in batches by the
+flush_presence Celery task; the sockets themselves never touch the user row.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from core.redis_client import get_redis
+from .wire import encode_frame
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# User IDs that currently have at least one live connection
+ONLINE_KEY = 'presence:online'
+# User IDs whose last_active/status changed since the last flush
+DIRTY_KEY = 'presence:dirty'
+# user_id -> last activity (unix seconds)
+LAST_ACTIVE_KEY = 'presence:last_active'
+
+
+def user_group_name(user_id):
+    """Channel group every socket of a user joins, used for per-user events"""
+    return f'user_{user_id}'
+
+
+def connections_key(user_id):
+    return f'presence:conns:{user_id}'
+
+
+def _mark_active(pipe, user_id, now):
+    pipe.hset(LAST_ACTIVE_KEY, user_id, now)
+    pipe.sadd(DIRTY_KEY, user_id)
+
+
+def connect(user_id, channel_name):
+    """Register a socket; returns True if the user just came online"""
+    now = time.time()
+    key = connections_key(user_id)
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.zremrangebyscore(key, '-inf', now)
+    pipe.zadd(key, {channel_name: now + settings.PRESENCE_TTL})
+    pipe.zcard(key)
+    pipe.expire(key, settings.PRESENCE_TTL)
+    pipe.sadd(ONLINE_KEY, user_id)
+    _mark_active(pipe, user_id, now)
+    _, _, connection_count, *_ = pipe.execute()
+    return connection_count == 1
+
+
+def _extend_lease(pipe, user_id, channel_name, now):
+    key = connections_key(user_id)
+    pipe.zadd(key, {channel_name: now + settings.PRESENCE_TTL})
+    pipe.expire(key, settings.PRESENCE_TTL)
+
+
+def renew(user_id, channel_name):
+    """Extend an open socket's lease without counting it as user activity"""
+    pipe = get_redis().pipeline(transaction=True)
+    _extend_lease(pipe, user_id, channel_name, time.time())
+    pipe.execute()
+
+
+def heartbeat(user_id, channel_name):
+    """Extend a socket's lease on a client heartbeat and record the activity"""
+    now = time.time()
+    pipe = get_redis().pipeline(transaction=True)
+    _extend_lease(pipe, user_id, channel_name, now)
+    _mark_active(pipe, user_id, now)
+    pipe.execute()
+
+
+def disconnect(user_id, channel_name):
+    """Unregister a socket; returns True if it was the user's last live one"""
+    now = time.time()
+    key = connections_key(user_id)
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.zrem(key, channel_name)
+    pipe.zremrangebyscore(key, '-inf', now)
+    pipe.zcard(key)
+    _mark_active(pipe, user_id, now)
+    removed, _, connection_count, *_ = pipe.execute()
+    if removed and connection_count == 0:
+        get_redis().srem(ONLINE_KEY, user_id)
+        return True
+    return False
+
+
+def online_user_ids(user_ids):
+    """The subset of user_ids with at least one live connection"""
+    now = time.time()
+    user_ids = list(user_ids)
+    pipe = get_redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.zcount(connections_key(user_id), now, '+inf')
+    return {user_id for user_id, count in zip(user_ids, pipe.execute()) if count}
+
+
+def is_online(user_id):
+    return bool(online_user_ids([user_id]))
+
+
+def expire_stale():
+    """Users whose every lease ran out without a disconnect (crashed server, dropped network)"""
+    r = get_redis()
+    candidates = [int(user_id) for user_id in r.smembers(ONLINE_KEY)]
+    stale = set(candidates) - online_user_ids(candidates)
+    if stale:
+        now = time.time()
+        pipe = r.pipeline(transaction=False)
+        pipe.srem(ONLINE_KEY, *stale)
+        for user_id in stale:
+            _mark_active(pipe, user_id, now)
+        pipe.execute()
+    return stale
+
+
+def pop_dirty(batch_size):
+    """Take up to batch_size changed users: {user_id: last_active unix time}"""
+    r = get_redis()
+    user_ids = r.spop(DIRTY_KEY, batch_size)
+    if not user_ids:
+        return {}
+    timestamps = r.hmget(LAST_ACTIVE_KEY, user_ids)
+    return {
+        int(user_id): float(timestamp)
+        for user_id, timestamp in zip(user_ids, timestamps)
+        if timestamp is not None
+    }
+
+
+def mark_dirty(user_ids):
+    """Put users back in the flush queue, e.g. after a failed write"""
+    if user_ids:
+        get_redis().sadd(DIRTY_KEY, *user_ids)
+
+
+def watcher_ids(user_id):
+    """Users who have user_id in their contacts and so see their presence"""
+    from users.models import Contact
+    return list(Contact.objects.filter(contact_id=user_id).values_list('user_id', flat=True))
+
+
+def presence_event(user_id, status):
+    """Channel-layer event carrying the encoded presence frame"""
+    return {
+        'type': 'forward_frame',
+        'frame': encode_frame({
+            'type': 'presence',
+            'user_id': str(user_id),
+            'status': status,
+            'timestamp': time.time(),
+        }),
+    }
+
+
+async def abroadcast_presence(channel_layer, user_id, status, watchers):
+    event = presence_event(user_id, status)
+    for watcher_id in watchers:
+        await channel_layer.group_send(user_group_name(watcher_id), event)
+
+
+def broadcast_presence(user_id, status):
+    """Send a presence change to the user's watchers only (for sync callers)"""
+    channel_layer = get_channel_layer()
+    async_to_sync(abroadcast_presence)(channel_layer, user_id, status, watcher_ids(user_id))
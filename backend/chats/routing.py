@@ -2,6 +2,8 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    # One socket per user, multiplexing all of the user's conversations
+    re_path(r'ws/user/$', consumers.UserConsumer.as_asgi()),
     # Support both URL patterns to maintain compatibility
     re_path(r'ws/conversation/(?P<conversation_id>[0-9a-f-]+)/$', consumers.ConversationConsumer.as_asgi()),
     re_path(r'ws/chat/(?P<conversation_id>[0-9a-f-]+)/$', consumers.ConversationConsumer.as_asgi()),
@@ -0,0 +1,180 @@
+"""
+Message search over the message_search_posting inverted index.
+
+A query reads the newest CHAT_SEARCH_MAX_POSTINGS postings of each
+(conversation, term) pair concurrently. Messages containing every query
+term are ranked by TF-IDF over that candidate set, newest first on ties.
+Each hit is re-checked against the stored message: deleted messages and
+terms no longer in an edited text are dropped, and their postings deleted.
+
+IDF depends on the candidate set, so scores move whenever matching
+messages are added or stale postings are removed. Pages therefore don't
+re-rank: the first page stores the ranked list (at most
+CHAT_SEARCH_MAX_HITS entries) in Redis for CHAT_SEARCH_CURSOR_TTL seconds,
+and a cursor is a position in that snapshot. Messages sent after the first
+page show up in a new search, not in later pages of the old one.
+"""
+from django.conf import settings
+from core.redis_client import get_redis
+from .cassandra_models import ChatMessage, MessageSearchPosting
+from .message_store import select_many
+from .tokenizer import tokenize
+import base64
+import logging
+import math
+import secrets
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidSearchCursor(ValueError):
+    pass
+
+
+def snapshot_key(snapshot_id):
+    return f'search:snapshot:{snapshot_id}'
+
+
+def encode_cursor(snapshot_id, position):
+    raw = f'{snapshot_id}:{position}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(snapshot id, position) of a token, raises InvalidSearchCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        snapshot_id, position = raw.split(':', 1)
+        position = int(position)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidSearchCursor('Invalid cursor') from e
+    if position < 0 or not snapshot_id:
+        raise InvalidSearchCursor('Invalid cursor')
+    return snapshot_id, position
+
+
+def _message_time(message_id):
+    return message_id.time if message_id.version == 1 else 0
+
+
+def rank(postings, terms):
+    """[(score, conversation_id, message_id)] of the messages holding every term, best first"""
+    candidate_count = len(postings)
+    document_frequency = {
+        term: sum(1 for term_counts in postings.values() if term in term_counts)
+        for term in terms
+    }
+    ranked = []
+    for (conversation_id, message_id), term_counts in postings.items():
+        if len(term_counts) < len(terms):
+            continue
+        score = sum(
+            (1 + math.log(term_counts[term])) * math.log(1 + candidate_count / document_frequency[term])
+            for term in terms
+        )
+        ranked.append((round(score, 6), conversation_id, message_id))
+    # message_id breaks ties between equal scores and times (legacy v4 ids have no time)
+    ranked.sort(key=lambda hit: (hit[0], _message_time(hit[2]), hit[2].bytes), reverse=True)
+    return ranked
+
+
+def _save_snapshot(terms, ranked):
+    """Store a ranked list and return its snapshot id, None if Redis is unavailable"""
+    snapshot_id = secrets.token_urlsafe(12)
+    key = snapshot_key(snapshot_id)
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        # The first element records the query so a cursor can't continue another one
+        pipe.rpush(key, ' '.join(terms), *[
+            f'{score!r}:{conversation_id}:{message_id}' for score, conversation_id, message_id in ranked
+        ])
+        pipe.expire(key, settings.CHAT_SEARCH_CURSOR_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Could not store search snapshot: %s", e)
+        return None
+    return snapshot_id
+
+
+def _load_snapshot(snapshot_id, terms):
+    """The ranked list of a snapshot, raises InvalidSearchCursor if it expired"""
+    entries = get_redis().lrange(snapshot_key(snapshot_id), 0, -1)
+    if not entries:
+        raise InvalidSearchCursor('Cursor expired, search again')
+    if entries[0] != ' '.join(terms):
+        raise InvalidSearchCursor('Cursor belongs to a different query')
+    ranked = []
+    for entry in entries[1:]:
+        score, conversation_id, message_id = entry.split(':')
+        ranked.append((float(score), uuid.UUID(conversation_id), uuid.UUID(message_id)))
+    return ranked
+
+
+def search_messages(conversation_ids, query, limit=20, cursor=None):
+    """
+    Search the given conversations. Returns (hits, next_cursor) where hits are
+    (message, score) pairs, best first.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    conversation_ids = list(conversation_ids)
+    if not terms or not conversation_ids:
+        return [], None
+
+    if cursor is None:
+        snapshot_id, position = None, 0
+        postings = MessageSearchPosting.get_postings(
+            conversation_ids, terms, settings.CHAT_SEARCH_MAX_POSTINGS
+        )
+        ranked = rank(postings, terms)[:settings.CHAT_SEARCH_MAX_HITS]
+    else:
+        snapshot_id, position = decode_cursor(cursor)
+        ranked = _load_snapshot(snapshot_id, terms)
+
+    # A snapshot entry is only shown while its conversation is still searchable
+    allowed = set(conversation_ids)
+    hits = []
+    stale = []
+    next_position = position
+    # Verify in chunks until the page is full; a few extra cover dropped hits
+    while len(hits) < limit and next_position < len(ranked):
+        chunk = ranked[next_position:next_position + limit - len(hits) + 5]
+        messages = {
+            (message.conversation_id, message.message_id): message
+            for message in select_many(ChatMessage.message_model(), [
+                key for key in (
+                    _message_key(cid, mid) for _, cid, mid in chunk if cid in allowed
+                ) if key
+            ])
+        }
+        for score, conversation_id, message_id in chunk:
+            if len(hits) == limit:
+                break
+            next_position += 1
+            if conversation_id not in allowed:
+                continue
+            message = messages.get((conversation_id, message_id))
+            current_terms = set(tokenize(message.text)) if message and not message.is_deleted else set()
+            missing = [term for term in terms if term not in current_terms]
+            if missing:
+                stale.extend((conversation_id, term, message_id) for term in missing)
+                continue
+            hits.append((message, score))
+
+    if stale:
+        MessageSearchPosting.remove(stale)
+
+    next_cursor = None
+    if next_position < len(ranked):
+        if snapshot_id is None:
+            snapshot_id = _save_snapshot(terms, ranked)
+        if snapshot_id is not None:
+            next_cursor = encode_cursor(snapshot_id, next_position)
+    return hits, next_cursor
+
+
+def _message_key(conversation_id, message_id):
+    try:
+        return ChatMessage.message_key(conversation_id, message_id)
+    except ChatMessage.DoesNotExist:
+        return None
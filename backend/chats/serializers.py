@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Conversation
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,30 +20,43 @@ class ConversationSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'is_group', 'is_direct', 'participants', 
                  'created_at', 'updated_at', 'direct_participants', 'last_message']
     def get_last_message(self, obj):
-        from .cassandra_models import ChatMessage
+        from .cassandra_models import ChatMessage, ConversationReadState
         import uuid
         
+        # The list view pre-fetches the last messages and read states of the whole page at once
+        last_messages = self.context.get('last_messages')
+        if last_messages is not None:
+            read_states = self.context.get('read_states', {})
+            return self._serialize_last_message(last_messages.get(obj.id), read_states.get(obj.id, {}))
+        
         try:
             # Get the most recent message for this conversation
-            messages = ChatMessage.objects.filter(
-                conversation_id=uuid.UUID(str(obj.id))
-            ).limit(1)
-            
-            if messages:
-                message = messages[0]
-                return {
-                    'id': str(message.message_id),
-                    'text': message.text,
-                    'sender_id': str(message.sender_id),
-                    'timestamp': message.message_timestamp.isoformat(),
-                    'is_read': message.is_read,
-                    'is_pinned': getattr(message, 'is_pinned', False),
-                    'has_attachment': getattr(message, 'has_attachment', False)
-                }
+            conversation_id = uuid.UUID(str(obj.id))
+            message = ChatMessage.get_last_messages([conversation_id]).get(conversation_id)
+            if message is None:
+                return None
+            return self._serialize_last_message(message, ConversationReadState.get_for_conversation(conversation_id))
         except Exception as e:
-            print(f"Error getting last message: {str(e)}")
+            logger.error("Error getting last message: %s", e)
         
         return None
+    
+    def _serialize_last_message(self, message, read_states):
+        from .cassandra_models import ConversationReadState
+        
+        if message is None:
+            return None
+        return {
+            'id': str(message.message_id),
+            'text': message.text,
+            'sender_id': str(message.sender_id),
+            'timestamp': message.message_timestamp.isoformat(),
+            # Read status comes from the participants' read watermarks
+            'is_read': getattr(message, 'is_read', False) or ConversationReadState.is_read(message, read_states),
+            # Summaries written before is_pinned was added hold null
+            'is_pinned': bool(getattr(message, 'is_pinned', False)),
+            'has_attachment': getattr(message, 'has_attachment', False)
+        }
 
 class MessageSerializer(serializers.Serializer):
     id = serializers.UUIDField()
@@ -50,6 +65,7 @@ class MessageSerializer(serializers.Serializer):
     text = serializers.CharField()
     timestamp = serializers.DateTimeField()
     is_read = serializers.BooleanField()
+    seen_by_count = serializers.IntegerField(required=False, default=0)
     read_at = serializers.DateTimeField(allow_null=True)
     is_edited = serializers.BooleanField()
     edited_at = serializers.DateTimeField(allow_null=True)
@@ -0,0 +1,38 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from .models import Conversation
+from . import access_cache
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_participant_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drop cached memberships when participants are added or removed
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        access_cache.invalidate_participants(instance.pk)
+    elif pk_set:
+        # user.conversations.add(...): instance is the user, pk_set the conversations
+        for conversation_id in pk_set:
+            access_cache.invalidate_participants(conversation_id)
+    else:
+        # user.conversations.clear(): the cleared conversations aren't passed in
+        for conversation_id in instance.conversations.values_list('id', flat=True):
+            access_cache.invalidate_participants(conversation_id)
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def invalidate_conversation_cache(sender, instance, **kwargs):
+    access_cache.invalidate_participants(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    access_cache.invalidate_user(instance.pk)
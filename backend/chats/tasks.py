@@ -0,0 +1,162 @@
+from celery import shared_task
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from datetime import datetime, timezone
+from . import activity
+from . import presence
+from . import write_behind
+from .cassandra_connection import reconnect_to_cassandra
+from .models import Conversation
+from .conversation_utils import store_message
+import logging
+import uuid
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_presence():
+    """
+    Write Redis presence to the user table in batches and expire dead sockets.
+    Scheduled by CELERY_BEAT_SCHEDULE.
+    """
+    for user_id in presence.expire_stale():
+        presence.broadcast_presence(user_id, 'offline')
+
+    flushed = 0
+    batch_size = settings.PRESENCE_FLUSH_BATCH_SIZE
+    while True:
+        last_active = presence.pop_dirty(batch_size)
+        if not last_active:
+            break
+        try:
+            flushed += _write_presence(last_active)
+        except Exception:
+            presence.mark_dirty(list(last_active))
+            raise
+        if len(last_active) < batch_size:
+            break
+    return flushed
+
+
+def _write_presence(last_active):
+    online = presence.online_user_ids(last_active)
+    users = list(User.objects.filter(id__in=last_active).only('id', 'status', 'last_active'))
+    for user in users:
+        user.last_active = datetime.fromtimestamp(last_active[user.id], tz=timezone.utc)
+        if user.id not in online:
+            user.status = 'offline'
+        elif user.status == 'offline':
+            # Keep a manually chosen away/busy status while connected
+            user.status = 'online'
+    User.objects.bulk_update(users, ['status', 'last_active'], batch_size=500)
+    return len(users)
+
+
+@shared_task
+def flush_conversation_activity():
+    """
+    Write debounced updated_at bumps to the conversation table, one bulk
+    UPDATE per batch. Scheduled by CELERY_BEAT_SCHEDULE.
+    """
+    flushed = 0
+    batch_size = settings.CONVERSATION_ACTIVITY_FLUSH_BATCH_SIZE
+    while True:
+        updated_at = activity.pop_dirty(batch_size)
+        if not updated_at:
+            break
+        try:
+            Conversation.objects.bulk_update(
+                [
+                    Conversation(
+                        id=uuid.UUID(conversation_id),
+                        updated_at=datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+                    )
+                    for conversation_id, timestamp in updated_at.items()
+                ],
+                ['updated_at'],
+                batch_size=500
+            )
+        except Exception:
+            activity.mark_dirty(list(updated_at))
+            raise
+        activity.forget(updated_at)
+        flushed += len(updated_at)
+        if len(updated_at) < batch_size:
+            break
+    return flushed
+
+
+@shared_task(bind=True, max_retries=None)
+def persist_pending_messages(self, conversation_id):
+    """
+    Store a conversation's write-behind queue in order (see write_behind).
+    The head message is retried with backoff until it is stored or dead-lettered.
+    """
+    token = write_behind.acquire_lock(conversation_id)
+    if token is None:
+        # Another worker is draining; persist_stale_messages covers the race
+        # where it finished just before our messages arrived
+        return 0
+
+    stored = 0
+    try:
+        while True:
+            entries = write_behind.peek(conversation_id, settings.CHAT_WRITE_BEHIND_BATCH_SIZE)
+            if not entries:
+                if write_behind.deactivate(conversation_id):
+                    break
+                continue
+            write_behind.extend_lock(conversation_id)
+            for entry in entries:
+                try:
+                    _store_entry(entry)
+                except Exception as e:
+                    attempts = write_behind.record_failure(entry)
+                    logger.warning("Persisting message %s failed (attempt %d): %s",
+                                   entry['message_id'], attempts, e)
+                    if attempts < settings.CHAT_WRITE_BEHIND_MAX_ATTEMPTS:
+                        countdown = min(2 ** attempts, 60)
+                        write_behind.defer(entry, countdown)
+                        raise self.retry(exc=e, countdown=countdown)
+                    write_behind.dead_letter(entry, str(e))
+                    write_behind.notify_failure(entry, 'Message could not be saved')
+                    continue
+                write_behind.ack(entry)
+                stored += 1
+    finally:
+        write_behind.release_lock(conversation_id, token)
+    return stored
+
+
+@shared_task
+def persist_stale_messages():
+    """
+    Schedule a drain for every conversation with pending messages, in case
+    its task was lost. Conversations whose head message is waiting for a
+    retry are skipped until the retry is due. Scheduled by CELERY_BEAT_SCHEDULE.
+    """
+    conversation_ids = write_behind.due_conversation_ids()
+    for conversation_id in conversation_ids:
+        persist_pending_messages.delay(conversation_id)
+    return len(conversation_ids)
+
+
+def _store_entry(entry):
+    # store_message counts the message only once every write that can fail
+    # has succeeded, so a retry of the same entry doesn't count it twice
+    store_message(
+        entry['conversation_id'],
+        entry['sender_id'],
+        entry['text'],
+        message_id=uuid.UUID(entry['message_id']),
+        message_timestamp=datetime.fromisoformat(entry['message_timestamp'])
+    )
+
+
+@worker_process_init.connect
+def reconnect_cassandra(**kwargs):
+    # The session opened in ChatsConfig.ready() belongs to the parent process
+    reconnect_to_cassandra()
@@ -0,0 +1,22 @@
+from django.test import SimpleTestCase
+from core.redis_client import get_redis
+import unittest
+
+
+class RedisTestCase(SimpleTestCase):
+    """Tests that need the Redis server from settings; skipped when it is unreachable"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            get_redis().ping()
+        except Exception as e:
+            raise unittest.SkipTest(f'Redis unavailable: {e}')
+
+    def delete_keys(self, *patterns):
+        r = get_redis()
+        for pattern in patterns:
+            keys = list(r.scan_iter(pattern))
+            if keys:
+                r.delete(*keys)
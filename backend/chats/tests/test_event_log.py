@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from types import SimpleNamespace
+from unittest import mock
+from cassandra.util import uuid_from_time
+from chats import event_log
+from chats.cassandra_models import ChatMessage, to_user_uuid
+from chats.views import ConversationViewSet
+from .base import RedisTestCase
+from datetime import datetime
+import json
+import uuid
+
+User = get_user_model()
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class RestEventLogTests(RedisTestCase):
+
+    def setUp(self):
+        self.conversation_id = uuid.uuid4()
+        self.addCleanup(self.delete_keys, f'events:*:{self.conversation_id}')
+        self.user = User(id=990000004, username='event-log-test')
+
+    def test_rest_edit_is_replayable(self):
+        message_id = uuid_from_time(datetime.now())
+        stored = SimpleNamespace(message_id=message_id, sender_id=to_user_uuid(self.user.id))
+        edited = SimpleNamespace(message_id=message_id, text='edited', edited_at=datetime.now())
+        request = APIRequestFactory().post(
+            f'/api/conversations/{self.conversation_id}/edit_message/',
+            {'message_id': str(message_id), 'text': 'edited'}, format='json'
+        )
+        force_authenticate(request, user=self.user)
+
+        with mock.patch.object(ConversationViewSet, 'get_object',
+                               return_value=SimpleNamespace(id=self.conversation_id)), \
+                mock.patch.object(ChatMessage, 'get_message', return_value=stored), \
+                mock.patch.object(ChatMessage, 'edit_message', return_value=edited), \
+                mock.patch('chats.views.get_participant_ids', return_value=[self.user.id]):
+            view = ConversationViewSet.as_view({'post': 'edit_message'})
+            response = view(request, pk=str(self.conversation_id))
+
+        self.assertEqual(response.status_code, 200)
+        frames, seq = event_log.events_after(self.conversation_id, 0)
+        self.assertEqual(seq, 1)
+        frame = json.loads(frames[0])
+        self.assertEqual(frame['seq'], 1)
+        self.assertEqual(frame['type'], 'edited')
+        self.assertEqual(frame['message_id'], str(message_id))
+        self.assertEqual(frame['text'], 'edited')
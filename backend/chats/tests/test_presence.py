@@ -0,0 +1,54 @@
+from django.test import override_settings
+from unittest import mock
+from chats import presence
+from chats.consumers import ChatConsumerBase
+from core.redis_client import get_redis
+from types import SimpleNamespace
+from .base import RedisTestCase
+import asyncio
+
+USER_ID = 990000001
+
+
+class StubChannelLayer:
+    async def group_add(self, group, channel):
+        pass
+
+    async def group_discard(self, group, channel):
+        pass
+
+    async def group_send(self, group, event):
+        pass
+
+
+@override_settings(PRESENCE_TTL=1, PRESENCE_RENEW_INTERVAL=0.2)
+@mock.patch('chats.presence.watcher_ids', return_value=[])
+class PresenceLeaseTests(RedisTestCase):
+
+    def setUp(self):
+        self.consumer = ChatConsumerBase()
+        self.consumer.user = SimpleNamespace(id=USER_ID, is_anonymous=False)
+        self.consumer.channel_name = 'test.presence!1'
+        self.consumer.channel_layer = StubChannelLayer()
+
+    def tearDown(self):
+        get_redis().srem(presence.ONLINE_KEY, USER_ID)
+        get_redis().delete(presence.connections_key(USER_ID))
+
+    async def test_open_socket_without_heartbeats_stays_online_past_ttl(self, watcher_ids):
+        await self.consumer.join_presence()
+        try:
+            await asyncio.sleep(2.5)
+            self.assertTrue(presence.is_online(USER_ID))
+            self.assertNotIn(USER_ID, presence.expire_stale())
+        finally:
+            await self.consumer.leave_presence()
+        self.assertFalse(presence.is_online(USER_ID))
+
+    async def test_lease_runs_out_when_renewal_stops(self, watcher_ids):
+        await self.consumer.join_presence()
+        # A crashed server stops renewing without disconnecting
+        self.consumer.presence_renewal.cancel()
+        await asyncio.sleep(1.5)
+        self.assertFalse(presence.is_online(USER_ID))
+        self.assertIn(USER_ID, presence.expire_stale())
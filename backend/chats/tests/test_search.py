@@ -0,0 +1,91 @@
+from unittest import mock
+from cassandra.util import uuid_from_time
+from chats import search
+from chats.tokenizer import term_counts
+from types import SimpleNamespace
+from .base import RedisTestCase
+import uuid
+
+
+class FakeIndex:
+    """Messages and postings of one conversation, standing in for Cassandra"""
+
+    def __init__(self):
+        self.conversation_id = uuid.uuid4()
+        self.messages = {}
+        self.clock = 1_700_000_000
+
+    def add(self, text, message_id=None):
+        self.clock += 1
+        message_id = message_id or uuid_from_time(self.clock)
+        self.messages[message_id] = SimpleNamespace(
+            conversation_id=self.conversation_id, message_id=message_id, text=text, is_deleted=False
+        )
+        return message_id
+
+    def get_postings(self, conversation_ids, terms, limit):
+        postings = {}
+        for message in self.messages.values():
+            counts = term_counts(message.text)
+            for term in terms:
+                if term in counts:
+                    postings.setdefault((message.conversation_id, message.message_id), {})[term] = counts[term]
+        return postings
+
+    def select_many(self, model, keys):
+        return [self.messages[message_id] for _, message_id in keys if message_id in self.messages]
+
+    def patch(self):
+        return [
+            mock.patch.object(search.MessageSearchPosting, 'get_postings', side_effect=self.get_postings),
+            mock.patch.object(search.MessageSearchPosting, 'remove'),
+            mock.patch.object(search, 'select_many', side_effect=self.select_many),
+            mock.patch.object(search, '_message_key', side_effect=lambda cid, mid: (cid, mid)),
+            mock.patch.object(search.ChatMessage, 'message_model'),
+        ]
+
+
+class SearchCursorTests(RedisTestCase):
+
+    def setUp(self):
+        self.index = FakeIndex()
+        for patcher in self.index.patch():
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.delete_keys, 'search:snapshot:*')
+
+    def search(self, query, cursor=None, limit=2):
+        hits, next_cursor = search.search_messages([self.index.conversation_id], query, limit=limit, cursor=cursor)
+        return [message.message_id for message, _ in hits], next_cursor
+
+    def test_messages_added_between_pages_do_not_shift_later_pages(self):
+        expected = [self.index.add(f'hello world {n}') for n in range(5)]
+        for n in range(5):
+            self.index.add(f'unrelated text {n}')
+
+        first, cursor = self.search('hello')
+        # New matches change every score's IDF
+        self.index.add('hello hello hello')
+        self.index.add('hello again')
+        second, cursor = self.search('hello', cursor)
+        third, cursor = self.search('hello', cursor)
+
+        self.assertIsNone(cursor)
+        seen = first + second + third
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertCountEqual(seen, expected)
+
+    def test_equal_scores_without_time_are_all_returned(self):
+        expected = [self.index.add('hello', message_id=uuid.uuid4()) for _ in range(5)]
+        seen, cursor = self.search('hello')
+        while cursor:
+            page, cursor = self.search('hello', cursor)
+            seen += page
+        self.assertCountEqual(seen, expected)
+
+    def test_cursor_of_another_query_is_rejected(self):
+        for n in range(3):
+            self.index.add(f'hello world {n}')
+        _, cursor = self.search('hello')
+        with self.assertRaises(search.InvalidSearchCursor):
+            self.search('world', cursor)
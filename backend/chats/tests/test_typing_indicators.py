@@ -0,0 +1,56 @@
+from django.test import override_settings
+from chats import typing_indicators
+from chats.consumers import ChatConsumerBase
+from types import SimpleNamespace
+from .base import RedisTestCase
+import asyncio
+import time
+import uuid
+
+USER_ID = 990000002
+
+
+@override_settings(TYPING_EXPIRY=5, TYPING_MIN_INTERVAL_MS=300)
+class TypingRateLimitTests(RedisTestCase):
+
+    def setUp(self):
+        self.conversation_id = str(uuid.uuid4())
+        self.addCleanup(self.delete_keys, f'typing:*{self.conversation_id}*')
+
+    def test_alternating_states_broadcast_once_per_window(self):
+        broadcasts = 0
+        for index in range(20):
+            broadcast, retry_after = typing_indicators.update(self.conversation_id, USER_ID, index % 2 == 0)
+            broadcasts += broadcast
+            if not broadcast and index % 2 == 1:
+                self.assertGreater(retry_after, 0)
+        self.assertEqual(broadcasts, 1)
+
+        time.sleep(0.35)
+        self.assertEqual(typing_indicators.update(self.conversation_id, USER_ID, False)[0], True)
+
+    def test_unchanged_state_is_not_deferred(self):
+        typing_indicators.update(self.conversation_id, USER_ID, True)
+        self.assertEqual(typing_indicators.update(self.conversation_id, USER_ID, True), (False, 0))
+
+    def test_forced_stop_skips_the_window(self):
+        typing_indicators.update(self.conversation_id, USER_ID, True)
+        self.assertTrue(typing_indicators.update(self.conversation_id, USER_ID, False, force=True)[0])
+
+    async def test_consumer_sends_latest_state_after_the_window(self):
+        consumer = ChatConsumerBase()
+        consumer.user = SimpleNamespace(id=USER_ID)
+        sent = []
+
+        async def broadcast_typing(conversation_id, is_typing):
+            sent.append(is_typing)
+
+        consumer.broadcast_typing = broadcast_typing
+        for index in range(9):
+            await consumer.handle_typing_indicator(self.conversation_id, {'is_typing': index % 2 == 0})
+        await consumer.handle_typing_indicator(self.conversation_id, {'is_typing': False})
+        self.assertEqual(sent, [True])
+
+        await asyncio.sleep(0.5)
+        self.assertEqual(sent, [True, False])
+        await consumer.stop_typing()
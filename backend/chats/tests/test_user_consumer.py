@@ -0,0 +1,24 @@
+from django.test import SimpleTestCase
+from chats.consumers import UserConsumer, canonical_conversation_id
+import uuid
+
+
+class SubscriptionIdTests(SimpleTestCase):
+
+    def test_ids_are_canonical(self):
+        conversation_id = uuid.uuid4()
+        for variant in (str(conversation_id).upper(), conversation_id.hex, f'{{{conversation_id}}}'):
+            self.assertEqual(canonical_conversation_id(variant), str(conversation_id))
+
+    def test_invalid_ids_are_none(self):
+        self.assertIsNone(canonical_conversation_id('not-a-uuid'))
+        self.assertIsNone(canonical_conversation_id(None))
+
+    def test_conversation_ids_must_be_a_list(self):
+        consumer = UserConsumer()
+        conversation_id = str(uuid.uuid4())
+        self.assertIsNone(consumer.frame_conversation_ids({'conversation_ids': conversation_id}))
+        self.assertEqual(
+            consumer.frame_conversation_ids({'conversation_ids': [conversation_id], 'conversation_id': 'x'}),
+            [conversation_id, 'x']
+        )
@@ -0,0 +1,37 @@
+from django.utils import timezone
+from chats import write_behind
+from core.redis_client import get_redis
+from .base import RedisTestCase
+import uuid
+
+USER_ID = 990000003
+
+
+class SweepBackoffTests(RedisTestCase):
+
+    def setUp(self):
+        self.conversation_id = str(uuid.uuid4())
+        self.addCleanup(self.forget_conversation)
+        write_behind.enqueue(self.conversation_id, USER_ID, uuid.uuid1(), timezone.now(), 'hello')
+        self.entry = write_behind.peek(self.conversation_id, 1)[0]
+
+    def forget_conversation(self):
+        r = get_redis()
+        r.delete(write_behind.queue_key(self.conversation_id))
+        r.srem(write_behind.ACTIVE_KEY, self.conversation_id)
+        r.hdel(write_behind.RETRY_AT_KEY, self.conversation_id)
+        r.hdel(write_behind.ATTEMPTS_KEY, self.entry['message_id'])
+
+    def test_sweep_skips_conversation_waiting_for_retry(self):
+        self.assertIn(self.conversation_id, write_behind.due_conversation_ids())
+        write_behind.defer(self.entry, 60)
+        self.assertNotIn(self.conversation_id, write_behind.due_conversation_ids())
+
+    def test_sweep_claims_conversation_once_retry_is_due(self):
+        write_behind.defer(self.entry, -1)
+        self.assertIn(self.conversation_id, write_behind.due_conversation_ids())
+
+    def test_ack_clears_backoff(self):
+        write_behind.defer(self.entry, 60)
+        write_behind.ack(self.entry)
+        self.assertIsNone(get_redis().hget(write_behind.RETRY_AT_KEY, self.conversation_id))
@@ -0,0 +1,41 @@
+"""
+Text normalization for message search.
+
+Terms are lowercased, with diacritics stripped so "nhắn" and "nhan" match,
+and split on anything that isn't a letter or digit.
+"""
+import re
+import unicodedata
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+# Longer messages only index their first distinct terms
+MAX_TERMS_PER_MESSAGE = 100
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text.lower().replace('đ', 'd'))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """Terms of a text, in order, with repeats"""
+    if not text:
+        return []
+    return [
+        term for term in _WORD_RE.findall(normalize(text))
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH
+    ]
+
+
+def term_counts(text):
+    """{term: occurrences} for the first MAX_TERMS_PER_MESSAGE distinct terms"""
+    counts = {}
+    for term in tokenize(text):
+        if term in counts:
+            counts[term] += 1
+        elif len(counts) < MAX_TERMS_PER_MESSAGE:
+            counts[term] = 1
+    return counts
@@ -0,0 +1,89 @@
+"""
+Server-side coalescing of typing indicators.
+
+Clients send a typing frame on every keystroke burst. Only state changes are
+fanned out: the first "typing" of a user in a conversation starts a Redis key
+with a TTL of TYPING_EXPIRY seconds, and repeated "typing" frames just extend
+it. A "stopped" is sent on an explicit stop or when the key expires.
+
+Changes are also rate limited to one per TYPING_MIN_INTERVAL_MS per user and
+conversation, so a client toggling on every keystroke can't fan out a
+broadcast per frame. A change inside the window is not recorded; the caller
+gets the time left and re-applies the latest state once it has passed. Every
+frame that isn't broadcast is counted as suppressed.
+"""
+from django.conf import settings
+from core.redis_client import get_redis
+
+STATS_KEY = 'typing:stats'
+
+# Returns {1, 0} if the frame must be broadcast now, {0, 0} if it changes
+# nothing, and {0, ms left in the window} if it is a rate-limited change
+_UPDATE_SCRIPT = """
+local wanted = ARGV[1] == '1'
+if wanted == (redis.call('EXISTS', KEYS[1]) == 1) then
+    if wanted then
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    redis.call('HINCRBY', KEYS[3], 'suppressed', 1)
+    return {0, 0}
+end
+if ARGV[4] ~= '1' then
+    local window_left = redis.call('PTTL', KEYS[2])
+    if window_left > 0 then
+        redis.call('HINCRBY', KEYS[3], 'suppressed', 1)
+        return {0, window_left}
+    end
+end
+if wanted then
+    redis.call('SET', KEYS[1], '1', 'EX', ARGV[2])
+else
+    redis.call('DEL', KEYS[1])
+end
+redis.call('SET', KEYS[2], '1', 'PX', ARGV[3])
+redis.call('HINCRBY', KEYS[3], 'sent', 1)
+return {1, 0}
+"""
+
+_update_script = None
+
+
+def typing_key(conversation_id, user_id):
+    return f'typing:{conversation_id}:{user_id}'
+
+
+def window_key(conversation_id, user_id):
+    return f'typing:window:{conversation_id}:{user_id}'
+
+
+def update(conversation_id, user_id, is_typing, force=False):
+    """Record a typing frame.
+
+    Returns (broadcast, retry_after): whether the frame changed the state and
+    must be broadcast, and for a rate-limited change the seconds until it may
+    be applied. force skips the rate limit (e.g. a closing socket's stop).
+    """
+    global _update_script
+    if _update_script is None:
+        _update_script = get_redis().register_script(_UPDATE_SCRIPT)
+    broadcast, window_left = _update_script(
+        keys=[typing_key(conversation_id, user_id), window_key(conversation_id, user_id), STATS_KEY],
+        args=[1 if is_typing else 0, settings.TYPING_EXPIRY, settings.TYPING_MIN_INTERVAL_MS, 1 if force else 0]
+    )
+    return bool(broadcast), window_left / 1000
+
+
+def remaining(conversation_id, user_id):
+    """Seconds until the typing state expires, 0 if it already has"""
+    return max(get_redis().pttl(typing_key(conversation_id, user_id)), 0) / 1000
+
+
+def get_stats():
+    stats = get_redis().hgetall(STATS_KEY)
+    sent = int(stats.get('sent', 0))
+    suppressed = int(stats.get('suppressed', 0))
+    return {'sent': sent, 'suppressed': suppressed, 'received': sent + suppressed}
+
+
+def reset_stats():
+    get_redis().delete(STATS_KEY)
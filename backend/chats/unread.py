@@ -0,0 +1,73 @@
+"""
+Per-user unread message counters kept in Redis.
+
+Each user has one hash, unread:<user_id>, mapping conversation IDs to the
+number of unread messages, so all counts of a user come back in one HGETALL.
+Counters are a cache: reconcile_unread_counts rebuilds them from the
+Cassandra read watermarks after a Redis loss. Both count the messages after
+a user's watermark, which their own messages move (see ConversationReadState).
+"""
+from core.redis_client import get_redis
+import logging
+
+logger = logging.getLogger(__name__)
+
+UNREAD_KEY = 'unread:{user_id}'
+
+
+def unread_key(user_id):
+    return UNREAD_KEY.format(user_id=user_id)
+
+
+def increment_unread(conversation_id, recipient_ids, sender_id=None):
+    """Count one new message for every recipient.
+
+    Sending moves the sender's read watermark to the message, so their count
+    for the conversation is cleared.
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in recipient_ids:
+            pipe.hincrby(unread_key(user_id), str(conversation_id), 1)
+        if sender_id is not None:
+            pipe.hdel(unread_key(sender_id), str(conversation_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to increment unread counters: %s", e)
+
+
+def set_unread(user_id, conversation_id, count):
+    """Set a user's unread count after a read receipt moved their watermark.
+
+    count is the number of messages after the new watermark, the same
+    definition reconcile_unread_counts rebuilds from.
+    """
+    try:
+        if count > 0:
+            get_redis().hset(unread_key(user_id), str(conversation_id), count)
+        else:
+            get_redis().hdel(unread_key(user_id), str(conversation_id))
+    except Exception as e:
+        logger.warning("Failed to reset unread counter: %s", e)
+
+
+def get_unread_counts(user_id):
+    """All non-zero unread counts of a user keyed by conversation ID"""
+    try:
+        counts = get_redis().hgetall(unread_key(user_id))
+    except Exception as e:
+        logger.warning("Failed to read unread counters: %s", e)
+        return {}
+    return {conversation_id: int(count) for conversation_id, count in counts.items() if int(count) > 0}
+
+
+def replace_unread_counts(counts_by_user):
+    """Overwrite the counters of several users ({user_id: {conversation_id: count}})"""
+    pipe = get_redis().pipeline(transaction=True)
+    for user_id, counts in counts_by_user.items():
+        key = unread_key(user_id)
+        pipe.delete(key)
+        counts = {str(cid): count for cid, count in counts.items() if count > 0}
+        if counts:
+            pipe.hset(key, mapping=counts)
+    pipe.execute()
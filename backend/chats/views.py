@@ -2,11 +2,23 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from .models import Conversation
 from .serializers import ConversationSerializer, MessageSerializer
-from .cassandra_models import ChatMessage
-from .conversation_utils import get_or_create_direct_conversation, create_group_conversation
+from .cassandra_models import (
+    ChatMessage, ConversationSummary, ConversationCounter, ConversationReadState,
+    newest_message_id, to_user_uuid
+)
+from .conversation_utils import (
+    get_or_create_direct_conversation, create_group_conversation, get_participant_ids,
+    record_message_sent
+)
+from .pagination import OLDER, NEWER, InvalidCursor, decode_cursor, encode_cursor, page_size
+from .search import InvalidSearchCursor, search_messages
+from . import activity
+from . import event_log
+from . import unread
 import uuid
 
 User = get_user_model()
@@ -30,6 +42,40 @@ class ConversationViewSet(viewsets.ModelViewSet):
             
         return queryset.order_by('-updated_at')
     
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        conversations = list(page if page is not None else queryset)
+        
+        # updated_at bumps not flushed to MySQL yet live in Redis; use them
+        # and re-sort the page so a conversation with new messages moves up
+        pending = activity.get_updated_at([conversation.id for conversation in conversations])
+        for conversation in conversations:
+            if conversation.id in pending and pending[conversation.id] > conversation.updated_at:
+                conversation.updated_at = pending[conversation.id]
+        conversations.sort(key=lambda conversation: conversation.updated_at, reverse=True)
+        
+        # Inbox previews come from the user's summary partition; conversations
+        # without a summary yet fall back to one concurrent batch of reads
+        last_messages = ConversationSummary.get_for_user(request.user.id)
+        missing_ids = [
+            conversation.id for conversation in conversations
+            if conversation.id not in last_messages
+        ]
+        if missing_ids:
+            last_messages.update(ChatMessage.get_last_messages(missing_ids))
+        
+        context = self.get_serializer_context()
+        context['last_messages'] = last_messages
+        context['read_states'] = ConversationReadState.get_for_conversations(
+            [conversation.id for conversation in conversations if conversation.id in last_messages]
+        )
+        
+        serializer = self.get_serializer(conversations, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     @action(detail=False, methods=['post']) # Changed detail back to False
     def start_direct_conversation(self, request): # Removed pk from signature
         """Start or continue a direct conversation with another user"""
@@ -90,52 +136,159 @@ class ConversationViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=False, methods=['get'])
+    def unread_counts(self, request):
+        """Get the current user's unread message count for every conversation"""
+        return Response(unread.get_unread_counts(request.user.id))
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Search message text in the user's conversations.
+        
+        ?q= is required; ?conversation_id= narrows it to one conversation,
+        ?cursor= continues from a previous page's next_cursor.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        conversations = Conversation.objects.filter(participants=request.user)
+        conversation_id = request.query_params.get('conversation_id')
+        if conversation_id:
+            try:
+                conversations = conversations.filter(id=uuid.UUID(conversation_id))
+            except ValueError:
+                return Response({"error": "Invalid conversation_id"}, status=status.HTTP_400_BAD_REQUEST)
+        conversation_ids = list(
+            conversations.order_by('-updated_at')
+            .values_list('id', flat=True)[:settings.CHAT_SEARCH_MAX_CONVERSATIONS]
+        )
+        
+        try:
+            hits, next_cursor = search_messages(
+                conversation_ids, query,
+                limit=page_size(request.query_params.get('limit')),
+                cursor=request.query_params.get('cursor') or None
+            )
+        except InvalidSearchCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        return Response({
+            'results': [
+                {
+                    'id': str(message.message_id),
+                    'conversation_id': str(message.conversation_id),
+                    'sender_id': str(message.sender_id),
+                    'text': message.text,
+                    'timestamp': message.message_timestamp.isoformat() if message.message_timestamp else None,
+                    'score': score,
+                }
+                for message, score in hits
+            ],
+            'next_cursor': next_cursor,
+        })
+    
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
-        """Get all messages for a conversation"""
+        """Get messages for a conversation, newest first.
+        
+        With ?cursor= (empty for the newest page) or ?after=<message_id> the
+        response is {"results", "next_cursor", "prev_cursor"}: next_cursor
+        pages to older messages, prev_cursor to newer ones. Without them the
+        legacy ?last_message_id= list response is returned.
+        """
         try:
             # Ensure conversation exists and user is a participant
             conversation = self.get_object()
+            conversation_id = uuid.UUID(pk)
+            limit = page_size(request.query_params.get('limit'))
+            
+            try:
+                if 'cursor' in request.query_params or 'after' in request.query_params:
+                    return self._messages_page(request, conversation_id, limit)
+            except InvalidCursor as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
             # Get messages from Cassandra
             last_message_id = request.query_params.get('last_message_id')
-            limit = int(request.query_params.get('limit', 50))
-            
-            if last_message_id:
-                messages = ChatMessage.get_messages(
-                    conversation_id=uuid.UUID(pk),
-                    last_message_id=uuid.UUID(last_message_id),
-                    limit=limit
-                )
-            else:                messages = ChatMessage.get_messages(
-                    conversation_id=uuid.UUID(pk),
-                    limit=limit
-                )
-            # Convert to list for serialization
-            message_list = []
-            for msg in messages:
-                message_list.append({
-                    'id': msg.message_id,
-                    'conversation_id': msg.conversation_id,
-                    'sender_id': msg.sender_id,
-                    'text': msg.text,
-                    'timestamp': msg.message_timestamp,
-                    'is_read': msg.is_read,
-                    'read_at': msg.read_at,
-                    'is_edited': msg.is_edited,
-                    'edited_at': msg.edited_at,
-                    'is_deleted': msg.is_deleted,
-                    'deleted_at': msg.deleted_at,
-                    'is_pinned': getattr(msg, 'is_pinned', False),
-                    'pinned_at': getattr(msg, 'pinned_at', None),
-                    'pinned_by': getattr(msg, 'pinned_by', None)
-                })
-            
-            serializer = MessageSerializer(message_list, many=True, context={'request': request})
-            return Response(serializer.data)
+            messages = ChatMessage.get_messages(
+                conversation_id=conversation_id,
+                last_message_id=uuid.UUID(last_message_id) if last_message_id else None,
+                limit=limit
+            )
+            return Response(self._serialize_messages(request, conversation_id, messages))
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    def _messages_page(self, request, conversation_id, limit):
+        """One keyset page; one extra row is read to know if more exist"""
+        if request.query_params.get('after'):
+            try:
+                direction, boundary = NEWER, uuid.UUID(request.query_params['after'])
+            except ValueError:
+                raise InvalidCursor('Invalid message id')
+        elif request.query_params.get('cursor'):
+            direction, boundary = decode_cursor(request.query_params['cursor'])
+        else:
+            direction, boundary = OLDER, None
+        
+        if direction == NEWER:
+            messages = ChatMessage.get_messages_after(conversation_id, boundary, limit + 1)
+            has_more = len(messages) > limit
+            messages = list(reversed(messages[:limit]))
+        else:
+            messages = ChatMessage.get_messages(conversation_id, limit=limit + 1, last_message_id=boundary)
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+        
+        if messages:
+            # prev_cursor is always set so the newest page doubles as the
+            # catch-up point; a newer page always has older messages behind it
+            newest_id, oldest_id = messages[0].message_id, messages[-1].message_id
+            prev_cursor = encode_cursor(NEWER, newest_id)
+            next_cursor = encode_cursor(OLDER, oldest_id) if has_more or direction == NEWER else None
+        else:
+            # Nothing newer yet: keep polling from the same boundary
+            prev_cursor = encode_cursor(NEWER, boundary) if direction == NEWER else None
+            next_cursor = None
+        
+        return Response({
+            'results': self._serialize_messages(request, conversation_id, messages),
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+        })
+    
+    def _serialize_messages(self, request, conversation_id, messages):
+        # Read status is derived from the participants' read watermarks
+        read_states = ConversationReadState.get_for_conversation(conversation_id)
+        
+        # Convert to list for serialization
+        message_list = []
+        for msg in messages:
+            seen_by_count = ConversationReadState.seen_by_count(msg, read_states)
+            message_list.append({
+                'id': msg.message_id,
+                'conversation_id': msg.conversation_id,
+                'sender_id': msg.sender_id,
+                'text': msg.text,
+                'timestamp': msg.message_timestamp,
+                'is_read': msg.is_read or seen_by_count > 0,
+                'seen_by_count': seen_by_count,
+                'read_at': msg.read_at,
+                'is_edited': msg.is_edited,
+                'edited_at': msg.edited_at,
+                'is_deleted': msg.is_deleted,
+                'deleted_at': msg.deleted_at,
+                'is_pinned': getattr(msg, 'is_pinned', False),
+                'pinned_at': getattr(msg, 'pinned_at', None),
+                'pinned_by': getattr(msg, 'pinned_by', None)
+            })
+        
+        serializer = MessageSerializer(message_list, many=True, context={'request': request})
+        return serializer.data
+    
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
         """Send a message in a conversation"""
@@ -149,15 +302,26 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversation = self.get_object()
             
             # Create message in Cassandra
+            participant_ids = get_participant_ids(conversation.id)
             message = ChatMessage.create_message(
                 conversation_id=uuid.UUID(pk),
                 sender_id=request.user.id,
-                text=text
+                text=text,
+                participant_ids=participant_ids
             )
-            
-            # Update conversation's updated_at
-            conversation.updated_at = message.message_timestamp
-            conversation.save(update_fields=['updated_at'])
+            # Recipients' unread counters and updated_at, shared with the WebSocket path
+            record_message_sent(conversation.id, request.user.id, participant_ids)
+            # Delivered and logged for replay like a socket message
+            event_log.publish(conversation.id, {
+                'type': 'message',
+                'conversation_id': str(conversation.id),
+                'message': {
+                    'id': str(message.message_id),
+                    'sender_id': str(message.sender_id),
+                    'text': message.text,
+                    'timestamp': message.message_timestamp.isoformat(),
+                }
+            })
             
             # Return the created message
             message_data = {
@@ -186,10 +350,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversation = self.get_object()
             
             # Check if the message exists and can be edited by this user
-            message = ChatMessage.objects.get(
-                conversation_id=uuid.UUID(pk),
-                message_id=uuid.UUID(message_id)
-            )
+            message = ChatMessage.get_message(uuid.UUID(pk), uuid.UUID(message_id))
             
             # Check if current user is the sender
             if str(message.sender_id) != str(request.user.id):
@@ -200,8 +361,17 @@ class ConversationViewSet(viewsets.ModelViewSet):
             updated_message = ChatMessage.edit_message(
                 conversation_id=uuid.UUID(pk),
                 message_id=uuid.UUID(message_id),
-                new_text=new_text
+                new_text=new_text,
+                participant_ids=get_participant_ids(conversation.id)
             )
+            event_log.publish(conversation.id, {
+                'type': 'edited',
+                'conversation_id': str(conversation.id),
+                'message_id': str(updated_message.message_id),
+                'text': updated_message.text,
+                'user_id': str(request.user.id),
+                'timestamp': updated_message.edited_at.isoformat()
+            })
             
             # Return the updated message
             message_data = {
@@ -229,10 +399,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversation = self.get_object()
             
             # Check if the message exists and can be deleted by this user
-            message = ChatMessage.objects.get(
-                conversation_id=uuid.UUID(pk),
-                message_id=uuid.UUID(message_id)
-            )
+            message = ChatMessage.get_message(uuid.UUID(pk), uuid.UUID(message_id))
             
             # Check if current user is the sender
             if str(message.sender_id) != str(request.user.id):
@@ -241,8 +408,15 @@ class ConversationViewSet(viewsets.ModelViewSet):
               # Delete the message
             ChatMessage.delete_message(
                 conversation_id=uuid.UUID(pk),
-                message_id=uuid.UUID(message_id)
+                message_id=uuid.UUID(message_id),
+                participant_ids=get_participant_ids(conversation.id)
             )
+            event_log.publish(conversation.id, {
+                'type': 'deleted',
+                'conversation_id': str(conversation.id),
+                'message_id': str(message.message_id),
+                'user_id': str(request.user.id)
+            })
             
             return Response({"status": "Message deleted"})
         except ChatMessage.DoesNotExist:
@@ -252,27 +426,76 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def mark_messages_read(self, request, pk=None):
-        """Mark messages as read in a conversation"""
+        """Mark messages as read in a conversation.
+        
+        Accepts message_id ("read up to this message") or a list of
+        message_ids, in which case the newest one becomes the read watermark.
+        """
         message_ids = request.data.get('message_ids', [])
+        if request.data.get('message_id'):
+            message_ids = [request.data['message_id']]
         
         if not message_ids:
-            return Response({"error": "message_ids is required"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "message_id or message_ids is required"}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
             # Ensure conversation exists and user is a participant
             conversation = self.get_object()
             
-            # Mark each message as read
-            for message_id in message_ids:
-                ChatMessage.mark_as_read(
-                    conversation_id=uuid.UUID(pk),
-                    message_id=uuid.UUID(message_id)
-                )
-            
-            return Response({"status": "Messages marked as read"})
+            # One watermark write covers every message up to the newest one
+            last_read_message_id, unread_count = ConversationReadState.mark_read(
+                conversation_id=uuid.UUID(pk),
+                user_id=request.user.id,
+                message_id=newest_message_id(message_ids)
+            )
+            # A receipt for a message behind the watermark leaves the count alone
+            if unread_count is not None:
+                unread.set_unread(request.user.id, conversation.id, unread_count)
+            event_log.publish(conversation.id, {
+                'type': 'read',
+                'conversation_id': str(conversation.id),
+                'user_id': str(request.user.id),
+                'message_ids': [str(message_id) for message_id in message_ids],
+                'last_read_message_id': str(last_read_message_id)
+            })
+            
+            return Response({
+                "status": "Messages marked as read",
+                "last_read_message_id": str(last_read_message_id)
+            })
+        except ChatMessage.DoesNotExist:
+            return Response({"error": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
+    @action(detail=True, methods=['get'])
+    def read_state(self, request, pk=None):
+        """Get every participant's read watermark and unread count"""
+        try:
+            # Ensure conversation exists and user is a participant
+            conversation = self.get_object()
+            conversation_id = uuid.UUID(pk)
+            
+            read_states = ConversationReadState.get_for_conversation(conversation_id)
+            participant_ids = get_participant_ids(conversation.id)
+            unread_counts = ConversationReadState.unread_counts(
+                participant_ids, read_states, ConversationCounter.get_count(conversation_id)
+            )
+            
+            participants = []
+            for participant_id in participant_ids:
+                state = read_states.get(to_user_uuid(participant_id))
+                participants.append({
+                    'user_id': participant_id,
+                    'last_read_message_id': state.last_read_message_id if state else None,
+                    'read_at': state.read_at if state else None,
+                    'unread_count': unread_counts[participant_id]
+                })
+            
+            return Response({"participants": participants})
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
     @action(detail=True, methods=['post'])
     def pin_message(self, request, pk=None):
         """Pin a message in a conversation"""
@@ -286,23 +509,29 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversation = self.get_object()
             
             # Check if the message exists
-            message = ChatMessage.objects.get(
-                conversation_id=uuid.UUID(pk),
-                message_id=uuid.UUID(message_id)
-            )
+            message = ChatMessage.get_message(uuid.UUID(pk), uuid.UUID(message_id))
             
             # Pin the message
             pinned_message = ChatMessage.pin_message(
                 conversation_id=uuid.UUID(pk),
                 message_id=uuid.UUID(message_id),
-                user_id=request.user.id
+                user_id=request.user.id,
+                participant_ids=get_participant_ids(conversation.id)
             )
-            
-            # Return the pinned message
+            event_log.publish(conversation.id, {
+                'type': 'pinned',
+                'conversation_id': str(conversation.id),
+                'message_id': str(pinned_message.message_id),
+                'user_id': str(request.user.id),
+                'pinned_at': pinned_message.pinned_at.isoformat() if pinned_message.pinned_at else None
+            })
+            
+            # Return the pinned message; the update doesn't re-read the row,
+            # so the content comes from the existence check above
             message_data = {
                 'message_id': pinned_message.message_id,
-                'text': pinned_message.text,
-                'sender_id': pinned_message.sender_id,
+                'text': message.text,
+                'sender_id': message.sender_id,
                 'is_pinned': pinned_message.is_pinned,
                 'pinned_at': pinned_message.pinned_at,
                 'pinned_by': pinned_message.pinned_by
@@ -327,10 +556,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversation = self.get_object()
             
             # Check if the message exists and is pinned
-            message = ChatMessage.objects.get(
-                conversation_id=uuid.UUID(pk),
-                message_id=uuid.UUID(message_id)
-            )
+            message = ChatMessage.get_message(uuid.UUID(pk), uuid.UUID(message_id))
             
             if not message.is_pinned:
                 return Response({"error": "Message is not pinned"}, status=status.HTTP_400_BAD_REQUEST)
@@ -338,8 +564,15 @@ class ConversationViewSet(viewsets.ModelViewSet):
             # Unpin the message
             ChatMessage.unpin_message(
                 conversation_id=uuid.UUID(pk),
-                message_id=uuid.UUID(message_id)
+                message_id=uuid.UUID(message_id),
+                participant_ids=get_participant_ids(conversation.id)
             )
+            event_log.publish(conversation.id, {
+                'type': 'unpinned',
+                'conversation_id': str(conversation.id),
+                'message_id': str(message.message_id),
+                'user_id': str(request.user.id)
+            })
             
             return Response({"status": "Message unpinned"})
         except ChatMessage.DoesNotExist:
@@ -355,7 +588,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
             conversation = self.get_object()
             
             # Get pinned messages from Cassandra
-            limit = int(request.query_params.get('limit', 10))
+            limit = page_size(request.query_params.get('limit', 10))
             
             pinned_messages = ChatMessage.get_pinned_messages(
                 conversation_id=uuid.UUID(pk),
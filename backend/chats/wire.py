@@ -0,0 +1,24 @@
+"""
+WebSocket frame encoding.
+
+Broadcasts are encoded once by the sender and the text frame travels in the
+channel-layer event ('frame'), so each recipient socket forwards it instead
+of running json.dumps again. orjson is used when installed.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+def encode_frame(payload):
+    """Encode a client frame to the text sent over the socket"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload)
+
+
+def encoder_name():
+    return 'orjson' if orjson is not None else 'json'
@@ -0,0 +1,189 @@
+"""
+Write-behind persistence for WebSocket messages (CHAT_WRITE_BEHIND).
+
+The consumer assigns the TimeUUID, broadcasts right away and appends the
+message to the Redis list writebehind:<conversation_id>. The
+persist_pending_messages task drains a conversation under a lock, head
+first, so messages of one conversation are stored in the order they were
+sent. A failing message stays at the head and is retried with backoff;
+after CHAT_WRITE_BEHIND_MAX_ATTEMPTS it moves to the dead-letter list and
+the sender gets a "message_failed" frame.
+
+Each queue is bounded by CHAT_WRITE_BEHIND_MAX_PENDING; a full queue rejects
+the message instead of growing. Conversations with pending messages are
+kept in writebehind:active so the periodic sweep picks up queues whose task
+was lost; conversations waiting out a retry backoff are left to their
+retry.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from core.redis_client import get_redis
+from .presence import user_group_name
+from .wire import encode_frame
+import json
+import time
+import uuid
+
+# Conversation IDs with a non-empty queue
+ACTIVE_KEY = 'writebehind:active'
+# Messages that could not be stored after every attempt
+DEAD_LETTER_KEY = 'writebehind:dead'
+# message_id -> failed attempts so far
+ATTEMPTS_KEY = 'writebehind:attempts'
+# conversation_id -> time its failed head message is retried
+RETRY_AT_KEY = 'writebehind:retry_at'
+
+# Returns the queue length after the push, 0 if the queue is full
+_ENQUEUE_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[3])
+return length
+"""
+
+# Drops the conversation from the active set unless a message arrived meanwhile
+_DEACTIVATE_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_scripts = {}
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+
+def queue_key(conversation_id):
+    return f'writebehind:{conversation_id}'
+
+
+def lock_key(conversation_id):
+    return f'writebehind:lock:{conversation_id}'
+
+
+def enqueue(conversation_id, sender_id, message_id, message_timestamp, text):
+    """Queue a message for persistence.
+
+    Returns the queue length, so the caller schedules a drain when it is 1,
+    or 0 when the queue is full and the message was rejected.
+    """
+    entry = json.dumps({
+        'conversation_id': str(conversation_id),
+        'sender_id': str(sender_id),
+        'message_id': str(message_id),
+        'message_timestamp': message_timestamp.isoformat(),
+        'text': text,
+    })
+    return _script(_ENQUEUE_SCRIPT)(
+        keys=[queue_key(conversation_id), ACTIVE_KEY],
+        args=[entry, settings.CHAT_WRITE_BEHIND_MAX_PENDING, str(conversation_id)]
+    )
+
+
+def acquire_lock(conversation_id):
+    """Become the only drainer of a conversation; returns a token or None"""
+    token = uuid.uuid4().hex
+    if get_redis().set(lock_key(conversation_id), token, nx=True, ex=settings.CHAT_WRITE_BEHIND_LOCK_TTL):
+        return token
+    return None
+
+
+def extend_lock(conversation_id):
+    """Keep the lock while a busy conversation is still being drained"""
+    get_redis().expire(lock_key(conversation_id), settings.CHAT_WRITE_BEHIND_LOCK_TTL)
+
+
+def release_lock(conversation_id, token):
+    _script(_RELEASE_SCRIPT)(keys=[lock_key(conversation_id)], args=[token])
+
+
+def peek(conversation_id, count):
+    """The oldest count pending messages, still queued"""
+    return [json.loads(entry) for entry in get_redis().lrange(queue_key(conversation_id), 0, count - 1)]
+
+
+def ack(entry):
+    """Drop a stored message from the head of its queue"""
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.lpop(queue_key(entry['conversation_id']))
+    pipe.hdel(ATTEMPTS_KEY, entry['message_id'])
+    pipe.hdel(RETRY_AT_KEY, entry['conversation_id'])
+    pipe.execute()
+
+
+def record_failure(entry):
+    """Count a failed attempt; returns the attempts so far"""
+    return get_redis().hincrby(ATTEMPTS_KEY, entry['message_id'], 1)
+
+
+def defer(entry, countdown):
+    """Keep the sweep away from a conversation until its retry is due"""
+    get_redis().hset(RETRY_AT_KEY, entry['conversation_id'], repr(time.time() + countdown))
+
+
+def dead_letter(entry, error):
+    """Give up on the head message and move it to the dead-letter list"""
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.lpop(queue_key(entry['conversation_id']))
+    pipe.hdel(ATTEMPTS_KEY, entry['message_id'])
+    pipe.hdel(RETRY_AT_KEY, entry['conversation_id'])
+    pipe.rpush(DEAD_LETTER_KEY, json.dumps(dict(entry, error=error)))
+    pipe.execute()
+
+
+def deactivate(conversation_id):
+    """Forget a drained conversation; False if it got new messages meanwhile"""
+    return bool(_script(_DEACTIVATE_SCRIPT)(
+        keys=[queue_key(conversation_id), ACTIVE_KEY],
+        args=[str(conversation_id)]
+    ))
+
+
+def due_conversation_ids():
+    """Conversations with pending messages that aren't waiting for a retry"""
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.smembers(ACTIVE_KEY)
+    pipe.hgetall(RETRY_AT_KEY)
+    active, retry_at = pipe.execute()
+    now = time.time()
+    return [
+        conversation_id for conversation_id in active
+        if float(retry_at.get(conversation_id, 0)) <= now
+    ]
+
+
+def failure_frame(conversation_id, message_id, error):
+    return {
+        'type': 'message_failed',
+        'conversation_id': str(conversation_id),
+        'message_id': str(message_id) if message_id else None,
+        'error': error,
+    }
+
+
+def notify_failure(entry, error):
+    """Tell every socket of the sender that their message was not stored"""
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        user_group_name(entry['sender_id']),
+        {
+            'type': 'forward_frame',
+            'frame': encode_frame(failure_frame(entry['conversation_id'], entry['message_id'], error)),
+        }
+    )
@@ -0,0 +1,32 @@
+"""
+Cursor pagination for the MySQL list endpoints.
+
+PageNumberPagination runs a COUNT(*) and reads pages with OFFSET, so both get
+slower the deeper and larger a table is. These classes page by keyset
+instead: each page is "WHERE <ordering column> past the cursor ... LIMIT n"
+over an indexed column, which costs the same on page 1 and page 10,000.
+Responses are {"next", "previous", "results"} with no total count.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    # page_size defaults to REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class UserCursorPagination(KeysetPagination):
+    """Users by primary key"""
+    ordering = 'id'
+
+
+class ContactCursorPagination(KeysetPagination):
+    """A user's contacts, newest first, over the (user, created_at) index"""
+    ordering = ('-created_at', '-id')
+
+
+class NotificationCursorPagination(KeysetPagination):
+    """A user's notifications, newest first, over the (recipient, created_at) index"""
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,16 @@
+"""
+Shared Redis client for application data (counters, presence, queues).
+Django's cache and the channel layer keep their own connections.
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Process-wide Redis client; redis-py pools the underlying connections"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
@@ -97,6 +97,25 @@ DATABASES = {
 CASSANDRA_HOSTS = [config('CASSANDRA_HOST', default='viberchat_cassandra')]
 CASSANDRA_KEYSPACE = 'viberchat'
 
+# Optional (conversation_id, time bucket) partitioning for chat messages.
+# Run the migrate_message_buckets command before enabling it on existing data.
+CHAT_MESSAGE_BUCKETING = config('CHAT_MESSAGE_BUCKETING', default=False, cast=bool)
+CHAT_MESSAGE_BUCKET_DAYS = config('CHAT_MESSAGE_BUCKET_DAYS', default=7, cast=int)
+
+# Page size of the messages endpoint; ?limit= is clamped to the maximum
+CHAT_MESSAGES_PAGE_SIZE = config('CHAT_MESSAGES_PAGE_SIZE', default=50, cast=int)
+CHAT_MESSAGES_MAX_PAGE_SIZE = config('CHAT_MESSAGES_MAX_PAGE_SIZE', default=100, cast=int)
+
+# Message search: postings are written on create/edit; a query reads at most
+# CHAT_SEARCH_MAX_POSTINGS per (conversation, term) in up to CHAT_SEARCH_MAX_CONVERSATIONS
+# of the user's most recently active conversations
+CHAT_SEARCH_INDEXING = config('CHAT_SEARCH_INDEXING', default=True, cast=bool)
+CHAT_SEARCH_MAX_POSTINGS = config('CHAT_SEARCH_MAX_POSTINGS', default=500, cast=int)
+CHAT_SEARCH_MAX_CONVERSATIONS = config('CHAT_SEARCH_MAX_CONVERSATIONS', default=200, cast=int)
+# Later pages walk a snapshot of the first page's ranking, kept this many hits for TTL seconds
+CHAT_SEARCH_MAX_HITS = config('CHAT_SEARCH_MAX_HITS', default=1000, cast=int)
+CHAT_SEARCH_CURSOR_TTL = config('CHAT_SEARCH_CURSOR_TTL', default=600, cast=int)
+
 # Redis settings for caching
 CACHES = {
     'default': {
@@ -105,6 +124,17 @@ CACHES = {
     }
 }
 
+# Redis for application data (unread counters, presence, queues)
+REDIS_URL = f"redis://{config('REDIS_HOST', default='redis')}:6379/2"
+
+# TTL (seconds) of the cached JWT user and conversation membership used on WebSocket connect
+CHAT_ACCESS_CACHE_TTL = config('CHAT_ACCESS_CACHE_TTL', default=60, cast=int)
+CHAT_ACCESS_CACHE_STATS_FLUSH_EVERY = config('CHAT_ACCESS_CACHE_STATS_FLUSH_EVERY', default=200, cast=int)
+
+# User search: Redis prefix index (users.search_index); results cached per query
+USER_SEARCH_MAX_RESULTS = config('USER_SEARCH_MAX_RESULTS', default=50, cast=int)
+USER_SEARCH_CACHE_TTL = config('USER_SEARCH_CACHE_TTL', default=30, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -158,6 +188,8 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
 }
+# Largest ?page_size= accepted by the cursor-paginated list endpoints
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=100, cast=int)
 
 # JWT settings
 SIMPLE_JWT = {
@@ -218,6 +250,50 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'flush-presence': {
+        'task': 'chats.tasks.flush_presence',
+        'schedule': config('PRESENCE_FLUSH_INTERVAL', default=30, cast=int),
+    },
+    'flush-conversation-activity': {
+        'task': 'chats.tasks.flush_conversation_activity',
+        'schedule': config('CONVERSATION_ACTIVITY_FLUSH_INTERVAL', default=1.0, cast=float),
+    },
+    'persist-stale-messages': {
+        'task': 'chats.tasks.persist_stale_messages',
+        'schedule': config('CHAT_WRITE_BEHIND_SWEEP_INTERVAL', default=5, cast=int),
+    },
+    'send-queued-otp-emails': {
+        'task': 'users.tasks.send_queued_otp_emails',
+        'schedule': config('OTP_EMAIL_SWEEP_INTERVAL', default=10, cast=int),
+    },
+}
+
+# Presence: a socket counts as connected for PRESENCE_TTL seconds after its lease was last renewed;
+# open sockets renew it every PRESENCE_RENEW_INTERVAL seconds
+PRESENCE_TTL = config('PRESENCE_TTL', default=90, cast=int)
+PRESENCE_RENEW_INTERVAL = config('PRESENCE_RENEW_INTERVAL', default=30, cast=float)
+PRESENCE_FLUSH_BATCH_SIZE = config('PRESENCE_FLUSH_BATCH_SIZE', default=1000, cast=int)
+
+# Conversation.updated_at bumps are kept in Redis and written by flush_conversation_activity
+CONVERSATION_ACTIVITY_FLUSH_BATCH_SIZE = config('CONVERSATION_ACTIVITY_FLUSH_BATCH_SIZE', default=1000, cast=int)
+
+# Seconds a typing indicator stays on without a new typing frame before "stopped" is sent
+TYPING_EXPIRY = config('TYPING_EXPIRY', default=5, cast=int)
+# At most one typing state change per user and conversation is broadcast in this many milliseconds
+TYPING_MIN_INTERVAL_MS = config('TYPING_MIN_INTERVAL_MS', default=1000, cast=int)
+
+# Replay log for the WebSocket resume frame: last N events per conversation, kept for TTL seconds
+CHAT_EVENT_LOG_SIZE = config('CHAT_EVENT_LOG_SIZE', default=500, cast=int)
+CHAT_EVENT_LOG_TTL = config('CHAT_EVENT_LOG_TTL', default=86400, cast=int)
+
+# Write-behind for WebSocket messages: broadcast first, store through a per-conversation
+# Redis queue drained by Celery. Redis should run with AOF persistence when this is on.
+CHAT_WRITE_BEHIND = config('CHAT_WRITE_BEHIND', default=False, cast=bool)
+CHAT_WRITE_BEHIND_MAX_PENDING = config('CHAT_WRITE_BEHIND_MAX_PENDING', default=1000, cast=int)
+CHAT_WRITE_BEHIND_BATCH_SIZE = config('CHAT_WRITE_BEHIND_BATCH_SIZE', default=100, cast=int)
+CHAT_WRITE_BEHIND_MAX_ATTEMPTS = config('CHAT_WRITE_BEHIND_MAX_ATTEMPTS', default=5, cast=int)
+CHAT_WRITE_BEHIND_LOCK_TTL = config('CHAT_WRITE_BEHIND_LOCK_TTL', default=60, cast=int)
 
 # Channels settings
 ASGI_APPLICATION = 'core.asgi.application'
@@ -238,6 +314,13 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+
+# OTP emails are queued in Redis and sent by Celery in batches over a pooled SMTP connection
+OTP_EMAIL_BATCH_SIZE = config('OTP_EMAIL_BATCH_SIZE', default=50, cast=int)
+OTP_EMAIL_MAX_ATTEMPTS = config('OTP_EMAIL_MAX_ATTEMPTS', default=5, cast=int)
+# Seconds before a claimed batch whose worker died goes back on the queue
+OTP_EMAIL_CLAIM_TIMEOUT = config('OTP_EMAIL_CLAIM_TIMEOUT', default=300, cast=int)
 
 # Site settings
 SITE_NAME = 'ViberChat'
@@ -263,3 +346,42 @@ SWAGGER_SETTINGS = {
     'REFETCH_SCHEMA_WITH_AUTH': True,
     'REFETCH_SCHEMA_ON_LOGOUT': True,
 }
+
+# Logging
+# Per-message debug lines (chats.messages) are sampled when enabled
+CHAT_LOG_LEVEL = config('CHAT_LOG_LEVEL', default='INFO')
+CHAT_MESSAGE_LOG_LEVEL = config('CHAT_MESSAGE_LOG_LEVEL', default='WARNING')
+CHAT_MESSAGE_LOG_SAMPLE_RATE = config('CHAT_MESSAGE_LOG_SAMPLE_RATE', default=0.01, cast=float)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'filters': {
+        'sample_messages': {
+            '()': 'chats.log_filters.SamplingFilter',
+            'rate': CHAT_MESSAGE_LOG_SAMPLE_RATE,
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'standard',
+        },
+    },
+    'loggers': {
+        'chats': {
+            'handlers': ['console'],
+            'level': CHAT_LOG_LEVEL,
+            'propagate': False,
+        },
+        'chats.messages': {
+            'level': CHAT_MESSAGE_LOG_LEVEL,
+            'filters': ['sample_messages'],
+        },
+    },
+}
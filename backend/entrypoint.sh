@@ -89,6 +89,13 @@ echo "Redis is available."
 echo "Running setup_cassandra management command..."
 python manage.py setup_cassandra
 
+# Messages with legacy random IDs sort above new ones; refuse to start until they are migrated
+echo "Checking message IDs..."
+if ! python manage.py migrate_message_ids --check; then
+  echo "ERROR: Legacy message IDs found. Run: python manage.py migrate_message_ids"
+  exit 1
+fi
+
 # =================================================================
 # Django database setup
 # =================================================================
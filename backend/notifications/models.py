@@ -65,6 +65,9 @@ class Notification(models.Model):
         verbose_name = _('notification')
         verbose_name_plural = _('notifications')
         db_table = 'notification'
+        indexes = [
+            models.Index(fields=['recipient', 'created_at'], name='notif_recipient_created_idx'),
+        ]
         
     def __str__(self):
         return f"{self.notification_type} for {self.recipient.username} at {self.created_at}"
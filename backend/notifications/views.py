@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.utils import timezone
+from core.pagination import NotificationCursorPagination
 from .models import Notification, NotificationSetting
 from .serializers import NotificationSerializer, NotificationSettingSerializer
 
@@ -12,6 +13,7 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationCursorPagination
     
     def get_queryset(self):
         # Check if this is a schema generation request
@@ -24,12 +26,10 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def unread(self, request):
         """Get only unread notifications"""
-        unread_notifications = Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        )
-        serializer = self.get_serializer(unread_notifications, many=True)
-        return Response(serializer.data)
+        unread_notifications = self.get_queryset().filter(is_read=False)
+        page = self.paginate_queryset(unread_notifications)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
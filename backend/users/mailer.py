@@ -0,0 +1,167 @@
+"""
+Queued OTP email delivery.
+
+Views push {email, otp_code, otp_type} onto the Redis list otp:email:queue
+and return. The send_queued_otp_emails task claims up to
+OTP_EMAIL_BATCH_SIZE entries at a time and sends them over one SMTP
+connection that each worker process keeps open between tasks, so a burst of
+sign-ups pays for one handshake instead of one per email. Entries that could
+not be sent go to send_otp_emails, which retries them with exponential
+backoff. A periodic sweep drains the queue in case a scheduled task was lost.
+
+Delivery is at-least-once: a claimed batch moves to its own processing list
+and is only dropped once sent or handed to the retry task. A batch whose
+worker died is put back on the queue after OTP_EMAIL_CLAIM_TIMEOUT seconds.
+"""
+from django.conf import settings
+from django.core.mail import get_connection
+from core.redis_client import get_redis
+from .utils import build_otp_email
+import json
+import logging
+import secrets
+import smtplib
+import time
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'otp:email:queue'
+# Claimed batch tokens scored by the time they are given up on
+CLAIMS_KEY = 'otp:email:claims'
+
+# Moves up to ARGV[1] entries from the queue to the batch's processing list
+_CLAIM_SCRIPT = """
+local entries = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #entries == 0 then
+    return entries
+end
+redis.call('LTRIM', KEYS[1], #entries, -1)
+redis.call('RPUSH', KEYS[2], unpack(entries))
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[3])
+return entries
+"""
+
+# Puts a batch's entries back at the head of the queue, in order
+_REQUEUE_SCRIPT = """
+local entries = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = #entries, 1, -1 do
+    redis.call('LPUSH', KEYS[2], entries[i])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return #entries
+"""
+
+_scripts = {}
+
+_connection = None
+
+
+class DeliveryError(Exception):
+    """Sending stopped at an entry; pending holds it and the ones after it"""
+
+    def __init__(self, pending, error):
+        super().__init__(str(error))
+        self.pending = pending
+
+
+def queue_otp_email(email, otp_code, otp_type):
+    """Queue an OTP email for the Celery workers"""
+    from .tasks import send_otp_emails, send_queued_otp_emails
+
+    entry = {'email': email, 'otp_code': str(otp_code), 'otp_type': otp_type}
+    try:
+        length = get_redis().rpush(QUEUE_KEY, json.dumps(entry))
+    except Exception as e:
+        logger.warning("OTP email queue unavailable, sending through Celery directly: %s", e)
+        send_otp_emails.delay([entry])
+        return
+    # Only the push that starts a batch schedules a drain; later ones join it
+    if length == 1:
+        send_queued_otp_emails.delay()
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+
+def processing_key(token):
+    return f'otp:email:processing:{token}'
+
+
+def claim_batch(size):
+    """(token, up to size queued entries, oldest first); ack or requeue the token when done"""
+    token = secrets.token_hex(8)
+    entries = _script(_CLAIM_SCRIPT)(
+        keys=[QUEUE_KEY, processing_key(token), CLAIMS_KEY],
+        args=[size, time.time() + settings.OTP_EMAIL_CLAIM_TIMEOUT, token]
+    )
+    return token, [json.loads(entry) for entry in entries]
+
+
+def ack(token):
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(processing_key(token))
+    pipe.zrem(CLAIMS_KEY, token)
+    pipe.execute()
+
+
+def requeue(token):
+    """Put a claimed batch back on the queue; returns the number of entries"""
+    return _script(_REQUEUE_SCRIPT)(keys=[processing_key(token), QUEUE_KEY, CLAIMS_KEY], args=[token])
+
+
+def requeue_expired():
+    """Requeue batches claimed more than OTP_EMAIL_CLAIM_TIMEOUT seconds ago"""
+    return sum(requeue(token) for token in get_redis().zrangebyscore(CLAIMS_KEY, '-inf', time.time()))
+
+
+def connection():
+    """This process's SMTP connection, opened on first use and kept open"""
+    global _connection
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+    _connection.open()
+    return _connection
+
+
+def close_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass
+        _connection = None
+
+
+def _send(entry):
+    message = build_otp_email(entry['email'], entry['otp_code'], entry['otp_type'])
+    try:
+        connection().send_messages([message])
+    except smtplib.SMTPServerDisconnected:
+        # The server dropped the idle connection; reconnect once
+        close_connection()
+        connection().send_messages([message])
+
+
+def send_batch(entries):
+    """
+    Send entries in order over the pooled connection. Returns the number
+    sent; raises DeliveryError with the unsent entries on a transient failure.
+    """
+    sent = 0
+    for index, entry in enumerate(entries):
+        try:
+            _send(entry)
+        except smtplib.SMTPRecipientsRefused as e:
+            # Retrying will not make the address valid
+            logger.warning("OTP email to %s refused: %s", entry['email'], e)
+            continue
+        except (smtplib.SMTPException, OSError) as e:
+            close_connection()
+            raise DeliveryError(entries[index:], e) from e
+        sent += 1
+    return sent
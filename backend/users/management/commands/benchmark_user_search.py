@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from core.redis_client import get_redis
+from users import search_index
+from types import SimpleNamespace
+import random
+import string
+import time
+
+FIRST_NAMES = ['an', 'binh', 'chi', 'dung', 'giang', 'hoa', 'khanh', 'linh', 'minh', 'nam',
+               'oanh', 'phuong', 'quang', 'son', 'thao', 'trang', 'tuan', 'vy', 'john', 'maria']
+LAST_NAMES = ['nguyen', 'tran', 'le', 'pham', 'hoang', 'huynh', 'phan', 'vu', 'vo', 'dang',
+              'bui', 'do', 'ho', 'ngo', 'duong', 'ly', 'smith', 'garcia', 'lee', 'kim']
+
+
+class Command(BaseCommand):
+    help = ('Prefix query latency of the user search index with synthetic users, '
+            'built in a separate Redis key and removed afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--prefix-lengths', type=int, nargs='+', default=[1, 2, 3, 5])
+
+    def handle(self, *args, **options):
+        terms_key = 'usersearch:benchmark:terms'
+        rng = random.Random(7)
+        r = get_redis()
+        r.delete(terms_key, search_index.built_key(terms_key))
+
+        try:
+            self.stdout.write(f'Indexing {options["users"]} synthetic users...')
+            start = time.perf_counter()
+            pipe = r.pipeline(transaction=False)
+            for user_id in range(1, options['users'] + 1):
+                user = self.synthetic_user(rng, user_id)
+                pipe.zadd(terms_key, {
+                    f'{term}{search_index.SEPARATOR}{user_id}': 0
+                    for term in search_index.user_terms(user)
+                })
+                if user_id % 10_000 == 0:
+                    pipe.execute()
+            pipe.execute()
+            search_index.mark_built(terms_key)
+            self.stdout.write(f'  {r.zcard(terms_key)} entries in {time.perf_counter() - start:.1f}s')
+
+            self.stdout.write(f'{"prefix":>6} {"p50 ms":>8} {"p99 ms":>8} {"avg ids":>8}')
+            for length in options['prefix_lengths']:
+                latencies, counts = [], []
+                for _ in range(options['queries']):
+                    name = rng.choice(FIRST_NAMES + LAST_NAMES) + ''.join(rng.choices(string.digits, k=4))
+                    query = name[:length]
+                    started = time.perf_counter()
+                    user_ids = search_index.search_user_ids(query, terms_key=terms_key, use_cache=False)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    counts.append(len(user_ids))
+                latencies.sort()
+                self.stdout.write(
+                    f'{length:>6} {latencies[len(latencies) // 2]:>8.2f} '
+                    f'{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:>8.2f} '
+                    f'{sum(counts) / len(counts):>8.1f}'
+                )
+        finally:
+            r.delete(terms_key, search_index.built_key(terms_key))
+
+    def synthetic_user(self, rng, user_id):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        username = f'{first_name}{rng.randint(0, 9999)}'
+        return SimpleNamespace(
+            id=user_id,
+            username=username,
+            first_name=first_name.title(),
+            last_name=last_name.title(),
+            email=f'{username}.{last_name}{user_id}@example.com',
+        )
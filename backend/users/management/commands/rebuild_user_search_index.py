@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from users.models import User
+from users import search_index
+
+
+class Command(BaseCommand):
+    help = 'Index every user in the Redis user search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        queryset = User.objects.order_by('id').only('id', 'username', 'email', 'first_name', 'last_name')
+        last_id = 0
+        indexed = 0
+        while True:
+            users = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+            if not users:
+                break
+            for user in users:
+                search_index.index_user(user)
+            indexed += len(users)
+            last_id = users[-1].id
+            self.stdout.write(f'  {indexed} users indexed')
+
+        # Searches fall back to the database until the index is complete
+        search_index.mark_built()
+        self.stdout.write(self.style.SUCCESS(f'Rebuild complete: {indexed} users indexed'))
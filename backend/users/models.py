@@ -72,6 +72,9 @@ class Contact(models.Model):
     class Meta:
         db_table = 'contact'
         unique_together = ('user', 'contact')
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='contact_user_created_idx'),
+        ]
         verbose_name = _('contact')
         verbose_name_plural = _('contacts')
         ordering = ['-created_at']
@@ -0,0 +1,141 @@
+"""
+Prefix index for user search, kept in Redis.
+
+Every user contributes entries "<term>\\x00<user_id>" to one sorted set where
+all scores are 0, so members sort lexicographically and a prefix query is a
+ZRANGEBYLEX slice instead of an icontains scan of the user table. Terms are
+the lowercased, unaccented username, first name, last name, full name, email
+and email local part. A user's current entries are remembered in
+usersearch:user:<id> so a save can replace them.
+
+Matching is by prefix of any term. The ids found for a query are cached for
+USER_SEARCH_CACHE_TTL seconds. Callers fall back to the database when Redis
+is unavailable or the index was never built (search_user_ids returns None):
+rebuild_user_search_index sets the <terms key>:built marker when it is done.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from core.redis_client import get_redis
+import hashlib
+import logging
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+TERMS_KEY = 'usersearch:terms'
+SEPARATOR = '\x00'
+
+# Fields whose change requires re-indexing a user
+INDEXED_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+def built_key(terms_key=TERMS_KEY):
+    return f'{terms_key}:built'
+
+
+def mark_built(terms_key=TERMS_KEY):
+    get_redis().set(built_key(terms_key), 1)
+
+
+def user_key(user_id):
+    return f'usersearch:user:{user_id}'
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', (text or '').strip().lower().replace('đ', 'd'))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def user_terms(user):
+    email = normalize(user.email)
+    terms = {
+        normalize(user.username),
+        normalize(user.first_name),
+        normalize(user.last_name),
+        normalize(f'{user.first_name} {user.last_name}'),
+        email,
+        email.split('@', 1)[0],
+    }
+    return {term for term in terms if term}
+
+
+def index_user(user, terms_key=TERMS_KEY):
+    """Replace a user's entries with ones for their current fields"""
+    entries = {f'{term}{SEPARATOR}{user.id}' for term in user_terms(user)}
+    r = get_redis()
+    old_entries = r.smembers(user_key(user.id))
+    pipe = r.pipeline(transaction=True)
+    stale = old_entries - entries
+    if stale:
+        pipe.zrem(terms_key, *stale)
+    pipe.zadd(terms_key, {entry: 0 for entry in entries})
+    pipe.delete(user_key(user.id))
+    if entries:
+        pipe.sadd(user_key(user.id), *entries)
+    pipe.execute()
+
+
+def remove_user(user_id, terms_key=TERMS_KEY):
+    r = get_redis()
+    entries = r.smembers(user_key(user_id))
+    pipe = r.pipeline(transaction=True)
+    if entries:
+        pipe.zrem(terms_key, *entries)
+    pipe.delete(user_key(user_id))
+    pipe.execute()
+
+
+def _cache_key(query, limit):
+    return f'usersearch:q:{limit}:' + hashlib.sha1(query.encode()).hexdigest()
+
+
+def search_user_ids(query, terms_key=TERMS_KEY, use_cache=True, exclude=(), limit=None):
+    """
+    IDs of users with a term starting with query, at most limit (default
+    USER_SEARCH_MAX_RESULTS), in term order. IDs in exclude are skipped
+    before the limit applies. None if the index is unavailable or not built.
+    """
+    query = normalize(query)
+    if not query:
+        return []
+
+    limit = limit or settings.USER_SEARCH_MAX_RESULTS
+    # Cached lists are cut at the limit, so they can't serve excluding queries
+    use_cache = use_cache and not exclude
+    if use_cache:
+        cached = cache.get(_cache_key(query, limit))
+        if cached is not None:
+            return cached
+
+    exclude = set(exclude)
+    user_ids = []
+    seen = set()
+    # Several terms of one user can match, so read a few extra entries per chunk
+    chunk_size = limit * 4
+    offset = 0
+    try:
+        r = get_redis()
+        if not r.exists(built_key(terms_key)):
+            return None
+        while len(user_ids) < limit:
+            entries = r.zrangebylex(
+                terms_key, f'[{query}', f'[{query}'.encode() + b'\xff', start=offset, num=chunk_size
+            )
+            for entry in entries:
+                user_id = int(entry.rsplit(SEPARATOR, 1)[1])
+                if user_id in seen or user_id in exclude:
+                    continue
+                seen.add(user_id)
+                user_ids.append(user_id)
+                if len(user_ids) >= limit:
+                    break
+            if len(entries) < chunk_size:
+                break
+            offset += chunk_size
+    except Exception as e:
+        logger.warning("User search index unavailable: %s", e)
+        return None
+
+    if use_cache:
+        cache.set(_cache_key(query, limit), user_ids, settings.USER_SEARCH_CACHE_TTL)
+    return user_ids
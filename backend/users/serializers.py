@@ -3,7 +3,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.utils import timezone
 from .models import Contact
-from .utils import send_otp_email
+from .mailer import queue_otp_email
 from .otp import generate_otp, verify_otp, OTP_REGISTRATION, OTP_PASSWORD_RESET, OTP_EMAIL_CHANGE
 
 User = get_user_model()
@@ -74,7 +74,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         )
         
         # Send OTP email
-        send_otp_email(user.email, otp_data['otp_code'], OTP_REGISTRATION)
+        queue_otp_email(user.email, otp_data['otp_code'], OTP_REGISTRATION)
         
         return user
 
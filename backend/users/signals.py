@@ -1,9 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from . import search_index
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=User)
 def update_last_active(sender, instance, created, **kwargs):
@@ -13,3 +16,24 @@ def update_last_active(sender, instance, created, **kwargs):
     if created:
         instance.last_active = timezone.now()
         instance.save(update_fields=['last_active'])
+
+
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep the user search index in sync with the searchable fields
+    """
+    if update_fields is not None and not search_index.INDEXED_FIELDS.intersection(update_fields):
+        return
+    try:
+        search_index.index_user(instance)
+    except Exception as e:
+        logger.warning("Failed to index user %s for search: %s", instance.id, e)
+
+
+@receiver(post_delete, sender=User)
+def remove_from_search_index(sender, instance, **kwargs):
+    try:
+        search_index.remove_user(instance.id)
+    except Exception as e:
+        logger.warning("Failed to remove user %s from search: %s", instance.id, e)
@@ -0,0 +1,53 @@
+from celery import shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from . import mailer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def send_queued_otp_emails():
+    """
+    Drain the OTP email queue in batches over the worker's SMTP connection
+    (see mailer). Also scheduled by CELERY_BEAT_SCHEDULE as a sweep.
+    """
+    requeued = mailer.requeue_expired()
+    if requeued:
+        logger.warning("Requeued %d OTP emails from abandoned batches", requeued)
+
+    sent = 0
+    while True:
+        token, entries = mailer.claim_batch(settings.OTP_EMAIL_BATCH_SIZE)
+        if not entries:
+            break
+        try:
+            try:
+                sent += mailer.send_batch(entries)
+            except mailer.DeliveryError as e:
+                logger.warning("Sending OTP emails failed, %d queued for retry: %s", len(e.pending), e)
+                send_otp_emails.apply_async((e.pending,), countdown=1)
+        except Exception:
+            mailer.requeue(token)
+            raise
+        mailer.ack(token)
+    return sent
+
+
+# acks_late so a batch isn't lost with a worker that dies mid-send
+@shared_task(bind=True, max_retries=None, acks_late=True, reject_on_worker_lost=True)
+def send_otp_emails(self, entries):
+    """Send OTP email entries, retrying the unsent ones with backoff"""
+    try:
+        return mailer.send_batch(entries)
+    except mailer.DeliveryError as e:
+        if self.request.retries + 1 >= settings.OTP_EMAIL_MAX_ATTEMPTS:
+            logger.error("Giving up on %d OTP emails: %s", len(e.pending), e)
+            return 0
+        raise self.retry(args=(e.pending,), exc=e, countdown=min(2 ** (self.request.retries + 1), 60))
+
+
+@worker_process_shutdown.connect
+def close_smtp_connection(**kwargs):
+    mailer.close_connection()
@@ -1,23 +1,36 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from functools import lru_cache
 from .otp import OTP_REGISTRATION, OTP_PASSWORD_RESET, OTP_EMAIL_CHANGE
 
+# Stands in for the code in the cached templates
+OTP_CODE_PLACEHOLDER = '__OTP_CODE__'
 
-def send_otp_email(email, otp_code, otp_type):
+SUBJECTS = {
+    OTP_REGISTRATION: 'Verify Your ViberChat Account',
+    OTP_PASSWORD_RESET: 'Reset Your ViberChat Password',
+    OTP_EMAIL_CHANGE: 'Verify Your New Email Address'
+}
+
+INTRODUCTIONS = {
+    OTP_REGISTRATION: 'Thank you for signing up for ViberChat. To complete your registration, please verify your email address by entering the verification code below:',
+    OTP_PASSWORD_RESET: 'We received a request to reset your password. Please enter the verification code below to proceed with resetting your password:',
+    OTP_EMAIL_CHANGE: 'We received a request to change your email address. Please enter the verification code below to confirm your new email address:',
+}
+
+
+@lru_cache(maxsize=None)
+def otp_email_template(otp_type):
     """
-    Send OTP verification email
+    (subject, plain text, HTML) of an OTP email type, built once per process
+    with OTP_CODE_PLACEHOLDER where the code goes
     """
-    subject_map = {
-        OTP_REGISTRATION: 'Verify Your ViberChat Account',
-        OTP_PASSWORD_RESET: 'Reset Your ViberChat Password',
-        OTP_EMAIL_CHANGE: 'Verify Your New Email Address'
-    }
+    subject = SUBJECTS.get(otp_type, 'ViberChat Verification Code')
+    introduction = INTRODUCTIONS.get(otp_type)
+    introduction_html = f'<p>{introduction}</p>' if introduction else ''
+    site_name = getattr(settings, 'SITE_NAME', 'ViberChat')
 
-    subject = subject_map.get(otp_type, 'ViberChat Verification Code')
-    
-    # Create HTML content
     html_message = f'''
     <html>
     <head>
@@ -39,45 +52,43 @@ def send_otp_email(email, otp_code, otp_type):
             </div>
             <div class="content">
                 <p>Hello,</p>
-    '''
-    
-    if otp_type == OTP_REGISTRATION:
-        html_message += '''
-                <p>Thank you for signing up for ViberChat. To complete your registration, please verify your email address by entering the verification code below:</p>
-        '''
-    elif otp_type == OTP_PASSWORD_RESET:
-        html_message += '''
-                <p>We received a request to reset your password. Please enter the verification code below to proceed with resetting your password:</p>
-        '''
-    elif otp_type == OTP_EMAIL_CHANGE:
-        html_message += '''
-                <p>We received a request to change your email address. Please enter the verification code below to confirm your new email address:</p>
-        '''
-    
-    html_message += f'''
-                <div class="code">{otp_code}</div>
+                {introduction_html}
+                <div class="code">{OTP_CODE_PLACEHOLDER}</div>
                 <p>This code will expire in 10 minutes for security reasons.</p>
                 <p>If you did not request this code, please ignore this email or contact support if you have concerns.</p>
             </div>
             <div class="footer">
-                <p>&copy; {settings.SITE_NAME if hasattr(settings, 'SITE_NAME') else 'ViberChat'} Team. All rights reserved.</p>
+                <p>&copy; {site_name} Team. All rights reserved.</p>
             </div>
         </div>
     </body>
     </html>
     '''
-    
+
     # Plain text version
     plain_message = strip_tags(html_message)
-    
-    # Send email
-    send_mail(
+    return subject, plain_message, html_message
+
+
+def build_otp_email(email, otp_code, otp_type, connection=None):
+    """OTP verification email as an EmailMultiAlternatives, ready to send"""
+    subject, plain_message, html_message = otp_email_template(otp_type)
+    otp_code = str(otp_code)
+    message = EmailMultiAlternatives(
         subject,
-        plain_message,
+        plain_message.replace(OTP_CODE_PLACEHOLDER, otp_code),
         settings.DEFAULT_FROM_EMAIL,
         [email],
-        html_message=html_message,
-        fail_silently=False,
+        connection=connection,
     )
-    
+    message.attach_alternative(html_message.replace(OTP_CODE_PLACEHOLDER, otp_code), 'text/html')
+    return message
+
+
+def send_otp_email(email, otp_code, otp_type):
+    """
+    Send OTP verification email right away, on a new SMTP connection.
+    Views queue it with users.mailer.queue_otp_email instead.
+    """
+    build_otp_email(email, otp_code, otp_type).send(fail_silently=False)
     return True
@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Q, Value
+from django.db.models.functions import Concat
 from django.utils import timezone
 from rest_framework import viewsets, generics, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from core.pagination import UserCursorPagination, ContactCursorPagination
 from .models import Contact
 from .serializers import (
     UserSerializer, 
@@ -16,12 +20,58 @@ from .serializers import (
     PasswordResetCompleteSerializer,
     ResendOTPSerializer
 )
-from users.utils import send_otp_email
+from users.mailer import queue_otp_email
+from users import search_index
 from users.otp import generate_otp, verify_otp, OTP_REGISTRATION, OTP_PASSWORD_RESET, OTP_EMAIL_CHANGE
 
 User = get_user_model()
 
 
+def in_id_order(users, user_ids):
+    """Users sorted like user_ids (the search index's order)"""
+    position = {user_id: index for index, user_id in enumerate(user_ids)}
+    return sorted(users, key=lambda user: position.get(user.id, len(position)))
+
+
+class UserPrefixSearchFilter(filters.SearchFilter):
+    """
+    ?search= through the Redis prefix index instead of icontains over the
+    user table; falls back to SearchFilter when the index is unavailable.
+
+    The index returns at most USER_SEARCH_MAX_RESULTS IDs, before any other
+    filter or the cursor applies. When other filters are in the query or the
+    index has more matches than that, the same prefix match runs in the
+    database instead so no match is cut off.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        if any(field in request.query_params for field in getattr(view, 'filterset_fields', ())):
+            return self.prefix_filter(queryset, query)
+        limit = settings.USER_SEARCH_MAX_RESULTS
+        user_ids = search_index.search_user_ids(query, limit=limit + 1)
+        if user_ids is None:
+            return super().filter_queryset(request, queryset, view)
+        if len(user_ids) > limit:
+            return self.prefix_filter(queryset, query)
+        return queryset.filter(id__in=user_ids)
+
+    @staticmethod
+    def prefix_filter(queryset, query):
+        """Users with a field starting with query, like the index's terms"""
+        return queryset.annotate(
+            full_name=Concat('first_name', Value(' '), 'last_name')
+        ).filter(
+            Q(username__istartswith=query)
+            | Q(first_name__istartswith=query)
+            | Q(last_name__istartswith=query)
+            | Q(full_name__istartswith=query)
+            | Q(email__istartswith=query)
+        )
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     API endpoint for user operations.
@@ -47,7 +97,8 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    pagination_class = UserCursorPagination
+    filter_backends = [DjangoFilterBackend, UserPrefixSearchFilter]
     filterset_fields = ['status']
     search_fields = ['username', 'email', 'first_name', 'last_name']
     
@@ -94,7 +145,7 @@ class UserViewSet(viewsets.ModelViewSet):
             )
             
             # Send OTP email
-            send_otp_email(user.email, otp_data['otp_code'], OTP_PASSWORD_RESET)
+            queue_otp_email(user.email, otp_data['otp_code'], OTP_PASSWORD_RESET)
             
             return Response({
                 "message": "Verification code has been sent to your email",
@@ -174,7 +225,7 @@ class RegisterView(generics.CreateAPIView):
         )
     
         # Send OTP email
-        send_otp_email(user.email, otp_data['otp_code'], OTP_REGISTRATION)
+        queue_otp_email(user.email, otp_data['otp_code'], OTP_REGISTRATION)
     
         return Response({
             "message": "Registration successful. Please check your email for verification code.",
@@ -275,7 +326,7 @@ class ResendOTPView(generics.GenericAPIView):
         )
         
         # Send OTP email
-        send_otp_email(email, otp_data['otp_code'], otp_type)
+        queue_otp_email(email, otp_data['otp_code'], otp_type)
         
         return Response({
             "message": f"Verification code has been sent to {email}"
@@ -322,7 +373,7 @@ class PasswordResetRequestView(generics.GenericAPIView):
         )
         
         # Send OTP email
-        send_otp_email(email, otp_data['otp_code'], OTP_PASSWORD_RESET)
+        queue_otp_email(email, otp_data['otp_code'], OTP_PASSWORD_RESET)
         
         return Response({
             "message": "Password reset code has been sent to your email"
@@ -394,6 +445,7 @@ class ContactViewSet(viewsets.ModelViewSet):
     """
     serializer_class = ContactSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ContactCursorPagination
     
     def get_queryset(self):
         # Check if this is a schema generation request
@@ -415,13 +467,20 @@ class ContactViewSet(viewsets.ModelViewSet):
             
         # Get all users matching query, excluding current user and existing contacts
         existing_contacts = Contact.objects.filter(user=request.user).values_list('contact_id', flat=True)
-        users = User.objects.filter(
-            username__icontains=query
-        ).exclude(
+        user_ids = search_index.search_user_ids(
+            query, exclude={request.user.id, *existing_contacts}, limit=10
+        )
+        if user_ids is None:
+            users = User.objects.filter(username__icontains=query)
+        else:
+            users = User.objects.filter(id__in=user_ids)
+        users = users.exclude(
             id=request.user.id
         ).exclude(
             id__in=existing_contacts
-        )[:10]
+        )
+        if user_ids is not None:
+            users = in_id_order(users, user_ids)
         
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer(users[:10], many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
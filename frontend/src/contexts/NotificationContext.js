@@ -55,8 +55,9 @@ export const NotificationProvider = ({ children }) => {
   const fetchUnreadNotifications = async () => {
     try {
       const { data } = await notificationAPI.getUnreadNotifications();
-      // Ensure data is an array
-      const unreadArray = Array.isArray(data) ? data : [];
+      // The endpoint is paginated; take the first page of results
+      const results = data && Array.isArray(data.results) ? data.results : data;
+      const unreadArray = Array.isArray(results) ? results : [];
 
       // Update notifications state with new unread ones
       setNotifications((prevNotifications) => {